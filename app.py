@@ -1,5 +1,29 @@
+import numpy as np
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import base64
+import collections
+import concurrent.futures
+import csv
 import datetime
+import functools
+import io
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import shutil
+import struct
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import weakref
+import zipfile
+import zlib
 
 # ================================================================
 # CONFIG
@@ -74,9 +98,9 @@ def short_name(dx):
     return SHORT_NAME.get(dx, dx)
 
 def dots(score, max_score=5):
-    filled = "●" * min(score, max_score)
-    empty = "○" * (max_score - min(score, max_score))
-    return filled + empty
+    # Weighted scores are fractional log-odds; round to whole dots
+    filled = max(0, min(int(round(score)), max_score))
+    return "●" * filled + "○" * (max_score - filled)
 
 
 # ================================================================
@@ -286,6 +310,8 @@ DISEASES = [
 
 BASELINE_ORDERS = ["CBC with differential", "CMP", "ESR", "CRP", "Urinalysis"]
 
+CAT_ORDER = ["Infectious", "Endemic", "Immunocompromised", "Rheumatologic", "Malignancy", "Noninfectious"]
+
 
 # ================================================================
 # PRIOR TEST NORMALIZATION MAP
@@ -299,39 +325,570 @@ PRIOR_MAP = {
     "Negative Brucella serology": ["Brucella serology"],
     "Negative HIV": ["HIV 1/2 Ag/Ab (4th gen)"],
     "Normal CT chest/abd/pelvis": ["CT chest/abdomen/pelvis with contrast"],
-    "Normal echocardiogram": ["TTE", "TEE"]
+    "Normal echocardiogram": ["TTE", "TEE"],
+    "Negative Quantiferon": ["Quantiferon TB"],
+    "Negative AFB smears": ["AFB smear x3"],
+    "Normal TTE": ["TTE"],
+    "Normal TEE": ["TEE"],
+    "Negative cryptococcal antigen": ["Serum cryptococcal antigen"],
+    "Negative Coxiella serology": ["Coxiella serology"],
+    "Negative Blastomyces antibody": ["Serum Blastomyces antibody"],
+    "Negative Coccidioides serology": ["Coccidioides serologic cascade"],
+    "Negative EBV PCR": ["EBV PCR"]
 }
+
+
 # ================================================================
-# DIFFERENTIAL ENGINE (with corrected MAC gating + sorting)
+# INPUT OPTIONS
+# ================================================================
+
+SEXES = ["Female", "Male"]
+IMMUNE_STATES = ["Immunocompetent", "HIV", "Transplant", "Biologics", "Chemotherapy"]
+TRANSPLANT_TYPES = ["Kidney", "Liver", "Lung", "Heart", "HSCT"]
+EBV_STATUSES = ["Unknown", "Positive", "Negative"]
+
+# Findings collected by the UI that no diagnosis uses as a trigger
+UI_ONLY_FINDINGS = [
+    "Fatigue", "Dyspnea", "RUQ pain / hepatodynia", "Myalgias",
+    "Palms/soles rash", "Leukopenia"
+]
+
+
+# ================================================================
+# CASE ENCODING (compact binary + URL-safe token)
+# ================================================================
+
+def intern_vocab():
+    vocab = []
+    for name in [t for d in DISEASES for t in d["triggers"]] + UI_ONLY_FINDINGS:
+        if name not in vocab:
+            vocab.append(name)
+    return tuple(vocab)
+
+FINDING_VOCAB = intern_vocab()
+FINDING_INDEX = {name: i for i, name in enumerate(FINDING_VOCAB)}
+PRIOR_VOCAB = tuple(PRIOR_MAP)
+PRIOR_INDEX = {name: i for i, name in enumerate(PRIOR_VOCAB)}
+
+# v2 appends a payload checksum
+CASE_VERSION = 2
+# Tokens from a build with a different vocabulary are rejected, not misread
+CASE_VOCAB_CRC = zlib.crc32("\x1f".join(
+    FINDING_VOCAB + PRIOR_VOCAB + tuple(SEXES + IMMUNE_STATES + TRANSPLANT_TYPES + EBV_STATUSES)
+).encode("utf-8")) & 0xFFFF
+
+# version, vocab crc, age, sex, immune, transplant, ebv, flags,
+# cd4, months since tx, tmax (tenths F), hr, fever days
+CASE_HEADER = struct.Struct("<BHBBBBBBHHHBH")
+FINDING_BYTES = (len(FINDING_VOCAB) + 7) // 8
+PRIOR_BYTES = (len(PRIOR_VOCAB) + 7) // 8
+# CRC-16 over header + masks, so a mistyped token is rejected, not misread
+CASE_CHECK = struct.Struct("<H")
+CASE_SIZE = CASE_HEADER.size + FINDING_BYTES + PRIOR_BYTES + CASE_CHECK.size
+NONE_B = 0xFF
+NONE_H = 0xFFFF
+
+def to_mask(names, index):
+    mask = 0
+    for name in names:
+        if name not in index:
+            raise ValueError(f"Unknown case field value: {name!r}")
+        mask |= 1 << index[name]
+    return mask
+
+def from_mask(mask, vocab):
+    if mask >> len(vocab):
+        raise ValueError("Case sets findings outside the vocabulary")
+    return [name for i, name in enumerate(vocab) if mask >> i & 1]
+
+def option_at(options, index, none=False):
+    if none and index == NONE_B:
+        return None
+    if index >= len(options):
+        raise ValueError(f"Case field out of range: option {index}")
+    return options[index]
+
+def option_index(options, value):
+    return NONE_B if value is None else field_index(options, value)
+
+def field_index(options, value):
+    if value not in options:
+        raise ValueError(f"Unknown case field value: {value!r}")
+    return options.index(value)
+
+def encode_case(inputs):
+    try:
+        header = CASE_HEADER.pack(
+            CASE_VERSION,
+            CASE_VOCAB_CRC,
+            inputs["age"],
+            field_index(SEXES, inputs["sex"]),
+            field_index(IMMUNE_STATES, inputs["immune"]),
+            option_index(TRANSPLANT_TYPES, inputs.get("transplant_type")),
+            option_index(EBV_STATUSES, inputs.get("ebv_status")),
+            int(bool(inputs.get("on_abx"))),
+            NONE_H if inputs.get("cd4") is None else inputs["cd4"],
+            NONE_H if inputs.get("time_since_tx") is None else inputs["time_since_tx"],
+            round(inputs["tmax"] * 10),
+            inputs["hr"],
+            inputs["fever_days"]
+        )
+    except struct.error as exc:
+        raise ValueError(f"Case field out of range: {exc}") from None
+
+    body = (
+        header
+        + to_mask(inputs["positives"], FINDING_INDEX).to_bytes(FINDING_BYTES, "little")
+        + to_mask(inputs["prior_neg"], PRIOR_INDEX).to_bytes(PRIOR_BYTES, "little")
+    )
+    return body + CASE_CHECK.pack(zlib.crc32(body) & 0xFFFF)
+
+def decode_case(data):
+    if data[:1] and data[0] != CASE_VERSION:
+        raise ValueError("Case was encoded by an incompatible version")
+    if len(data) != CASE_SIZE:
+        raise ValueError("Malformed case encoding")
+    body = data[:-CASE_CHECK.size]
+    if CASE_CHECK.unpack_from(data, len(body))[0] != zlib.crc32(body) & 0xFFFF:
+        raise ValueError("Case token is damaged (checksum mismatch)")
+
+    (version, crc, age, sex, immune, tx, ebv, flags,
+     cd4, months, tmax, hr, fever_days) = CASE_HEADER.unpack_from(data)
+    if crc != CASE_VOCAB_CRC:
+        raise ValueError("Case was encoded by an incompatible version")
+
+    offset = CASE_HEADER.size
+    positives = int.from_bytes(data[offset:offset + FINDING_BYTES], "little")
+    prior_neg = int.from_bytes(data[offset + FINDING_BYTES:len(body)], "little")
+
+    return {
+        "age": age,
+        "sex": option_at(SEXES, sex),
+        "immune": option_at(IMMUNE_STATES, immune),
+        "time_since_tx": None if months == NONE_H else months,
+        "cd4": None if cd4 == NONE_H else cd4,
+        "tmax": tmax / 10,
+        "hr": hr,
+        "fever_days": fever_days,
+        "positives": from_mask(positives, FINDING_VOCAB),
+        "prior_neg": from_mask(prior_neg, PRIOR_VOCAB),
+        "on_abx": bool(flags & 1),
+        "transplant_type": option_at(TRANSPLANT_TYPES, tx, none=True),
+        "ebv_status": option_at(EBV_STATUSES, ebv, none=True)
+    }
+
+def case_token(inputs):
+    return base64.urlsafe_b64encode(encode_case(inputs)).rstrip(b"=").decode("ascii")
+
+def case_from_token(token):
+    try:
+        data = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    except (ValueError, TypeError):
+        raise ValueError("Malformed case token") from None
+    return decode_case(data)
+
+# Encoded bytes are canonical, so they double as a cache/dedup key
+case_key = encode_case
+
+
+# ================================================================
+# INPUT SCHEMA — sidebar finding widgets, compiled once per process
+# ================================================================
+
+# (sidebar header, [(expander, [(label, widget key, findings)])])
+INPUT_SCHEMA = [
+    ("Symptoms (ROS)", [
+        ("Constitutional", [
+            ("Night sweats", "ui_ns", ["Night sweats"]),
+            ("Weight loss", "ui_wl", ["Weight loss"]),
+            ("Fatigue", "ui_fat", ["Fatigue"])
+        ]),
+        ("Neurologic", [
+            ("Headache", "ui_hx", ["Headache"]),
+            ("Vision changes", "ui_vc", ["Vision changes"]),
+            ("Seizures", "ui_sz", ["Seizures"]),
+            ("Jaw claudication", "ui_jc", ["Jaw claudication"])
+        ]),
+        ("Respiratory", [
+            ("Chronic cough", "ui_cc", ["Chronic cough"]),
+            ("Hemoptysis", "ui_hemo", ["Hemoptysis"]),
+            ("Dyspnea", "ui_dysp", ["Dyspnea"])
+        ]),
+        ("GI / Hepatic", [
+            ("Abdominal pain", "ui_abd", ["Abdominal pain"]),
+            ("Diarrhea", "ui_diarr", ["Diarrhea"]),
+            ("RUQ pain / hepatodynia", "ui_ruq", ["RUQ pain / hepatodynia"])
+        ]),
+        ("MSK", [
+            ("Arthralgia", "ui_arth", ["Arthralgia"]),
+            ("Back pain", "ui_bp", ["Back pain"]),
+            ("Myalgias", "ui_myalg", ["Myalgias"])
+        ]),
+        ("Skin findings", [
+            ("Rash", "ui_rash", ["Rash"]),
+            ("Palms/soles rash", "ui_palms", ["Palms/soles rash"]),
+            ("Skin nodules/lesions", "ui_nod", ["Skin nodules/lesions"]),
+            ("Oral ulcers", "ui_oral", ["Oral ulcers"])
+        ]),
+        ("Lymph / Heme", [
+            ("Lymphadenopathy", "ui_lad", ["Lymphadenopathy"]),
+            ("Splenomegaly", "ui_spl", ["Splenomegaly"]),
+            ("Pancytopenia", "ui_pan", ["Pancytopenia"])
+        ]),
+        ("Cardiac findings", [
+            ("New murmur", "ui_new_murmur", ["New murmur"]),
+            ("Embolic phenomena", "ui_emboli", ["Embolic phenomena"]),
+            ("Prosthetic valve", "ui_pv", ["Prosthetic valve"]),
+            ("Relative bradycardia (manual)", "ui_relbrady", ["Relative bradycardia"])
+        ]),
+        ("Lab abnormalities", [
+            ("Ferritin > 1000", "ui_ferritin", ["Ferritin > 1000"]),
+            ("Eosinophilia", "ui_eos", ["Eosinophilia"]),
+            ("Leukopenia", "ui_leuk", ["Leukopenia"]),
+            ("Transaminitis", "ui_trans", ["Transaminitis"])
+        ]),
+        ("Recent drug exposures", [
+            ("New beta-lactam", "ui_new_beta", ["New beta-lactam"]),
+            ("New anticonvulsant", "ui_new_anti", ["New anticonvulsant"]),
+            ("New sulfa", "ui_new_sulfa", ["New sulfa"])
+        ])
+    ]),
+    ("Exposures and Risks", [
+        ("Animals / Environment", [
+            ("Cat exposure", "ui_cats", ["Cats"]),
+            ("Livestock / farm animals", "ui_live", ["Livestock exposure", "Farm animals"]),
+            ("Parturient animals (births, placentas)", "ui_partur", ["Parturient animals", "Farm animals"]),
+            ("Bird/bat exposure", "ui_bb", ["Bird/bat exposure"]),
+            ("Unpasteurized dairy", "ui_dairy", ["Unpasteurized dairy"]),
+            ("Rural living", "ui_rural", ["Rural living", "Farm animals"]),
+            ("Well water", "ui_well", ["Well water"]),
+            ("Body lice", "ui_lice", ["Body lice"])
+        ]),
+        ("Social / TB Risk", [
+            ("IV drug use", "ui_ivdu", ["IV drug use"]),
+            ("Homelessness/incarceration", "ui_hl", ["Homelessness/incarceration"]),
+            ("TB exposure", "ui_tbexp", ["TB exposure"]),
+            ("High TB burden travel", "ui_tbtravel", ["High TB burden travel"])
+        ]),
+        ("Geography", [
+            ("Missouri / Ohio River Valley", "ui_mo", ["Missouri/Ohio River Valley"]),
+            ("US Southwest travel", "ui_swus", ["US Southwest travel"]),
+            ("Mediterranean / Mexico travel", "ui_medmex", ["Travel Mediterranean/Mexico"])
+        ]),
+        ("Comorbidities", [
+            ("Cirrhosis", "ui_cirr", ["Cirrhosis"])
+        ])
+    ])
+]
+
+# Findings set by the engine from non-checkbox inputs (see expand_positives)
+DERIVED_FINDINGS = {
+    "HIV": "Immune status HIV",
+    "Biologics": "Immune status Biologics",
+    "Chemotherapy": "Immune status Chemotherapy",
+    "EBV positive": "EBV status Positive",
+    "Relative bradycardia": "Tmax >= 102 F with HR < 100"
+}
+
+def compile_input_schema(schema):
+    keys = []
+    widget_findings = {}
+
+    for section, groups in schema:
+        for group, widgets in groups:
+            for label, key, findings in widgets:
+                if key in widget_findings:
+                    raise ValueError(f"Duplicate input widget key {key!r}")
+                unknown = [f for f in findings if f not in FINDING_INDEX]
+                if unknown:
+                    raise ValueError(f"Input {key!r} maps to unknown trigger(s): {', '.join(unknown)}")
+                keys.append(key)
+                widget_findings[key] = findings
+
+    reachable = {f for findings in widget_findings.values() for f in findings} | set(DERIVED_FINDINGS)
+    unreachable = [t for t in FINDING_VOCAB if t not in reachable]
+    if unreachable:
+        raise ValueError(f"Trigger(s) unreachable from the input schema: {', '.join(unreachable)}")
+
+    matrix = np.zeros((len(keys), len(FINDING_VOCAB)), dtype=np.uint8)
+    for row, key in enumerate(keys):
+        matrix[row, [FINDING_INDEX[f] for f in widget_findings[key]]] = 1
+
+    return tuple(keys), widget_findings, matrix
+
+# Fails at import if the schema and DISEASES drift apart
+WIDGET_KEYS, WIDGET_FINDINGS, WIDGET_MATRIX = compile_input_schema(INPUT_SCHEMA)
+
+def assemble_positives(checked, tmax=None, hr=None):
+    # checked: one flag per WIDGET_KEYS entry
+    hits = np.asarray(checked, dtype=np.uint8) @ WIDGET_MATRIX
+    positives = [FINDING_VOCAB[i] for i in np.flatnonzero(hits)]
+
+    # Automatic relative bradycardia trigger (Option C)
+    if tmax is not None and has_faget(tmax, hr) and "Relative bradycardia" not in positives:
+        positives.append("Relative bradycardia")
+
+    return positives
+
+
+# ================================================================
+# WEIGHTED SCORING (sparse log-likelihood-ratio weights)
+# ================================================================
+
+# Natural-log likelihood ratios per (diagnosis, trigger); any pair not
+# listed keeps the unit weight, so weighted mode degrades to counting.
+LR_WEIGHTS = {
+    "Infective endocarditis": {
+        "New murmur": 2.3, "Embolic phenomena": 2.0, "Prosthetic valve": 1.5, "IV drug use": 1.4
+    },
+    "Tuberculosis (miliary or extrapulmonary)": {
+        "TB exposure": 1.8, "High TB burden travel": 1.3, "Hemoptysis": 1.2,
+        "Night sweats": 0.6, "Weight loss": 0.6
+    },
+    "Cryptococcal meningitis": {"HIV": 1.5, "Headache": 1.2, "Vision changes": 1.2},
+    "Bartonella (endocarditis/bacteremia)": {"Cats": 1.6, "Body lice": 1.6},
+    "Brucellosis": {"Unpasteurized dairy": 2.0, "Travel Mediterranean/Mexico": 1.4, "Night sweats": 0.5},
+    "Q fever (Coxiella)": {"Parturient animals": 2.0, "Farm animals": 1.2, "Rural living": 0.4},
+    "Disseminated histoplasmosis": {"Bird/bat exposure": 1.6, "Pancytopenia": 1.3},
+    "Coccidioidomycosis": {"US Southwest travel": 2.2, "Night sweats": 0.4, "Weight loss": 0.4},
+    "Temporal arteritis (GCA)": {"Jaw claudication": 2.3, "Vision changes": 1.4},
+    "Adult Still disease": {"Ferritin > 1000": 2.3, "Rash": 1.2},
+    "Lymphoma or occult malignancy": {"Lymphadenopathy": 1.4, "Splenomegaly": 1.2},
+    "Drug fever": {"Eosinophilia": 1.6, "Relative bradycardia": 1.4}
+}
+
+# Log prior odds offsets per diagnosis (0 when unlisted)
+DX_PRIORS = {
+    "Infective endocarditis": 0.3,
+    "Tuberculosis (miliary or extrapulmonary)": 0.2,
+    "Lymphoma or occult malignancy": 0.2,
+    "Cryptococcal meningitis": -0.3,
+    "Post-transplant lymphoproliferative disorder (PTLD)": -0.3
+}
+
+class CSRMatrix:
+    # Minimal compressed-sparse-row matrix on numpy arrays
+
+    def __init__(self, indptr, indices, data, shape):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.data = np.asarray(data, dtype=np.float64)
+        self.shape = shape
+        self.row_ids = np.repeat(np.arange(shape[0]), np.diff(self.indptr))
+
+    @classmethod
+    def from_rows(cls, rows, n_cols):
+        indptr = [0]
+        indices = []
+        data = []
+        for row in rows:
+            for col, value in sorted(row.items()):
+                indices.append(col)
+                data.append(value)
+            indptr.append(len(indices))
+        return cls(indptr, indices, data, (len(rows), n_cols))
+
+    def dot(self, x):
+        contrib = self.data * np.asarray(x, dtype=np.float64)[self.indices]
+        return np.bincount(self.row_ids, weights=contrib, minlength=self.shape[0])
+
+    @functools.cached_property
+    def T(self):
+        order = np.lexsort((self.row_ids, self.indices))
+        counts = np.bincount(self.indices, minlength=self.shape[1])
+        return CSRMatrix(
+            np.concatenate(([0], np.cumsum(counts))),
+            self.row_ids[order],
+            self.data[order],
+            (self.shape[1], self.shape[0])
+        )
+
+    def dot_batch(self, X):
+        # X: cases x columns, mostly zeros. Each case's nonzero columns pull
+        # their rows of the transpose, so cost scales with the hits, not nnz.
+        # Only bench.py calls this: bulk export and the census pass score
+        # in unit mode through plan_for_key, which never touches LR_WEIGHTS.
+        X = np.asarray(X, dtype=np.float64)
+        n_cases, n_rows = X.shape[0], self.shape[0]
+        cases, cols = np.nonzero(X)
+        t = self.T
+
+        starts = t.indptr[cols]
+        lengths = t.indptr[cols + 1] - starts
+        hit = np.repeat(np.arange(len(cols)), lengths)
+        pos = starts[hit] + np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+        flat = cases[hit] * n_rows + t.indices[pos]
+        values = X[cases, cols][hit] * t.data[pos]
+        return np.bincount(flat, weights=values, minlength=n_cases * n_rows).reshape(n_cases, n_rows)
+
+def compile_lr_weights():
+    rows = []
+    for d in DISEASES:
+        weights = LR_WEIGHTS.get(d["dx"], {})
+        unknown = set(weights) - set(d["triggers"])
+        if unknown:
+            raise ValueError(f"LR weights for {d['dx']!r} name non-triggers: {', '.join(sorted(unknown))}")
+        rows.append({FINDING_INDEX[t]: weights.get(t, 1.0) for t in d["triggers"]})
+    priors = np.array([DX_PRIORS.get(d["dx"], 0.0) for d in DISEASES])
+    return CSRMatrix.from_rows(rows, len(FINDING_VOCAB)), priors
+
+LR_MATRIX, LR_PRIORS = compile_lr_weights()
+
+def finding_vector(positives):
+    x = np.zeros(len(FINDING_VOCAB))
+    x[[FINDING_INDEX[p] for p in positives if p in FINDING_INDEX]] = 1.0
+    return x
+
+def weighted_scores(positives):
+    return LR_MATRIX.dot(finding_vector(positives)) + LR_PRIORS
+
+
 # ================================================================
+# DECISION TRACING (sampled, size-bounded)
+# ================================================================
+
+# Fraction of runs traced without the sidebar toggle (0 = only on demand)
+TRACE_SAMPLE_RATE = float(os.environ.get("FUO_TRACE_SAMPLE", 0))
+TRACE_MAX_EVENTS = int(os.environ.get("FUO_TRACE_MAX_EVENTS", 512))
+TRACE_KEEP = int(os.environ.get("FUO_TRACE_KEEP", 200))
+# Traces carry case tokens (PHI); exporting every session's needs this set
+TRACE_ADMIN = os.environ.get("FUO_TRACE_ADMIN", "") == "1"
+
+class DecisionTrace:
+    # Events are (kind, subject, detail) tuples; kinds are
+    # match/gate/boost/active/no_match/order/suppress
+
+    __slots__ = ("events", "limit", "dropped")
+
+    def __init__(self, limit=TRACE_MAX_EVENTS):
+        self.events = []
+        self.limit = limit
+        self.dropped = 0
+
+    def add(self, kind, subject, detail):
+        if len(self.events) < self.limit:
+            self.events.append((kind, subject, detail))
+        else:
+            self.dropped += 1
+
+    def records(self):
+        return [{"kind": k, "subject": s, "detail": d} for k, s, d in self.events]
+
+class Tracer:
+
+    def __init__(self, rate=TRACE_SAMPLE_RATE, limit=TRACE_MAX_EVENTS, keep=TRACE_KEEP):
+        self.rate = rate
+        self.limit = limit
+        self.traces = collections.deque(maxlen=keep)
+        self.lock = threading.Lock()
+
+    def start(self, force=False):
+        # None means "not sampled"; engine functions skip all trace work
+        if force or (self.rate and random.random() < self.rate):
+            return DecisionTrace(self.limit)
+        return None
+
+    def finish(self, trace, case, session):
+        if trace is not None:
+            with self.lock:
+                self.traces.append((time.time(), session, case, trace))
+
+    def retained(self, session=None):
+        # session=None means every session's traces (admin export only)
+        with self.lock:
+            return [t for t in self.traces if session is None or t[1] == session]
+
+    def export_jsonl(self, session=None):
+        return "\n".join(
+            json.dumps({
+                "ts": ts,
+                "case": case,
+                "dropped": trace.dropped,
+                "events": trace.records()
+            })
+            for ts, _, case, trace in self.retained(session)
+        )
+
+@st.cache_resource
+def decision_tracer():
+    return Tracer()
+
 
-def build_differential(inputs):
+# ================================================================
+# DIFFERENTIAL ENGINE (with corrected MAC gating + sorting)
+# ================================================================
 
+def expand_positives(inputs):
     positives = set(inputs["positives"])
-    age = inputs["age"]
-    immune = inputs["immune"]
     cd4 = inputs.get("cd4")
-    transplant_type = inputs.get("transplant_type")
-    ebv_status = inputs.get("ebv_status")
-
-    risk_hiv = immune == "HIV"
-    risk_tx = immune == "Transplant"
 
     # HIV logic
-    if risk_hiv:
+    if inputs["immune"] == "HIV":
         positives.add("HIV")
         if cd4 is not None and cd4 < 250:
             positives.add("CD4 < 250")
         if cd4 is not None and cd4 < 100:
             positives.add("CD4 < 100")
 
+    # Immunosuppressive therapy
+    if inputs["immune"] in ["Biologics", "Chemotherapy"]:
+        positives.add(inputs["immune"])
+
     # EBV logic
-    if ebv_status == "Positive":
+    if inputs.get("ebv_status") == "Positive":
         positives.add("EBV positive")
 
+    return positives
+
+def failed_gate(d, inputs, positives):
+    immune = inputs["immune"]
+    cd4 = inputs.get("cd4")
+    transplant_type = inputs.get("transplant_type")
+    risk_hiv = immune == "HIV"
+    risk_tx = immune == "Transplant"
+
+    # Age gate
+    if d.get("requires_age_min") and inputs["age"] < d["requires_age_min"]:
+        return "age"
+
+    # HIV gate
+    if d.get("requires_hiv") and not risk_hiv:
+        return "hiv"
+
+    # Neuro gate
+    if d.get("requires_neuro") and not neuro_flag(positives):
+        return "neuro"
+
+    # Transplant gate
+    if d.get("requires_transplant") and not risk_tx:
+        return "transplant"
+
+    # Corrected MAC gating
+    if d["dx"] == "Disseminated MAC":
+        allow_mac = False
+        if risk_hiv and cd4 is not None and cd4 < 50:
+            allow_mac = True
+        if risk_tx and transplant_type == "Lung":
+            allow_mac = True
+        if not allow_mac:
+            return "mac"
+
+    return None
+
+def transplant_boost(d, inputs):
+    transplant_type = inputs.get("transplant_type")
+    if inputs["immune"] == "Transplant" and transplant_type in d.get("soft_triggers_transplant", []):
+        return f"{transplant_type} transplant"
+    return None
+
+def build_differential(inputs, weighted=False, trace=None):
+
+    positives = expand_positives(inputs)
+    weights = weighted_scores(positives) if weighted else None
     active = []
 
-    for d in DISEASES:
+    for i, d in enumerate(DISEASES):
         score = 0
         reasons = []
 
@@ -341,50 +898,55 @@ def build_differential(inputs):
                 score += 1
                 reasons.append(t)
 
-        # Age gate
-        if d.get("requires_age_min") and age < d["requires_age_min"]:
-            continue
-
-        # HIV gate
-        if d.get("requires_hiv") and not risk_hiv:
-            continue
-
-        # Neuro gate
-        if d.get("requires_neuro") and not neuro_flag(positives):
-            continue
-
-        # Transplant gate
-        if d.get("requires_transplant") and not risk_tx:
+        if failed_gate(d, inputs, positives):
             continue
 
         # Soft transplant boosts
-        if risk_tx and transplant_type in d.get("soft_triggers_transplant", []):
+        boost = transplant_boost(d, inputs)
+        if boost:
             score += 1
-            reasons.append(f"{transplant_type} transplant")
-
-        # Corrected MAC gating
-        if d["dx"] == "Disseminated MAC":
-            allow_mac = False
-            if risk_hiv and cd4 is not None and cd4 < 50:
-                allow_mac = True
-            if risk_tx and transplant_type == "Lung":
-                allow_mac = True
-            if not allow_mac:
-                continue
+            reasons.append(boost)
 
         if score > 0:
             active.append({
                 "dx": d["dx"],
                 "cat": d["cat"],
-                "score": score,
+                "score": score if weights is None else round(float(weights[i]) + bool(boost), 2),
                 "reasons": reasons,
                 "orders": d["orders"]
             })
 
     # descending sort
     active.sort(key=lambda x: x["score"], reverse=True)
+
+    # Traced runs replay the same helpers afterwards, so the untraced loop
+    # above carries no per-diagnosis tracing checks
+    if trace is not None:
+        trace_differential(trace, inputs, positives, active)
     return active
 
+def trace_differential(trace, inputs, positives, active):
+    scores = {item["dx"]: item["score"] for item in active}
+
+    for d in DISEASES:
+        reasons = tuple(t for t in d["triggers"] if t in positives)
+        if reasons:
+            trace.add("match", d["dx"], reasons)
+
+        gate = failed_gate(d, inputs, positives)
+        if gate:
+            trace.add("gate", d["dx"], gate)
+            continue
+
+        boost = transplant_boost(d, inputs)
+        if boost:
+            trace.add("boost", d["dx"], boost)
+
+        if d["dx"] in scores:
+            trace.add("active", d["dx"], scores[d["dx"]])
+        else:
+            trace.add("no_match", d["dx"], None)
+
 
 # ================================================================
 # HELPER: score lookup
@@ -401,7 +963,7 @@ def score_for(active_list, diagnosis):
 # ORDER ENGINE
 # ================================================================
 
-def build_orders(active, prior_neg):
+def build_orders(active, prior_neg, trace=None):
     orders_by_tier = {0: set(BASELINE_ORDERS), 1: set(), 2: set(), 3: set()}
 
     for item in active:
@@ -409,121 +971,1187 @@ def build_orders(active, prior_neg):
             orders_by_tier[tier].add(order)
 
     # Remove prior-neg equivalents
-    already_done = set()
-    for neg in prior_neg:
-        already_done.update(PRIOR_MAP.get(neg, []))
+    already_done = done_orders(prior_neg)
+
+    if trace is not None:
+        trace_orders(trace, active, orders_by_tier, prior_neg, already_done)
 
     for tier in orders_by_tier:
         orders_by_tier[tier] = {
             o for o in orders_by_tier[tier]
-            if not any(done in o for done in already_done)
+            if not is_done(o, already_done)
         }
 
     return orders_by_tier
 
+def trace_orders(trace, active, orders_by_tier, prior_neg, already_done):
+    for item in active:
+        for order, tier in item["orders"]:
+            trace.add("order", item["dx"], (order, tier))
+
+    for tier, orders in orders_by_tier.items():
+        for o in sorted(orders):
+            if is_done(o, already_done):
+                by = next(n for n in prior_neg if is_done(o, PRIOR_MAP.get(n, [])))
+                trace.add("suppress", o, (tier, by))
+
+def done_orders(prior_neg):
+    already_done = set()
+    for neg in prior_neg:
+        already_done.update(PRIOR_MAP.get(neg, []))
+    return already_done
+
+def is_done(order, already_done):
+    # Prefix match: "TEE" covers "TEE if concern persists after TTE", but
+    # "TTE" does not
+    return any(order.startswith(done) for done in already_done)
+
 
 # ================================================================
-# NOTE BUILDER
+# TEST SEQUENCING (precomputed next-test tables)
 # ================================================================
 
-def build_note(inputs, active, orders):
-    today = datetime.date.today().isoformat()
-    age = inputs["age"]
-    sex = inputs["sex"]
+SEQUENCE_TOP_N = 4
+# Floor for a diagnosis's belief weight (weighted scores can be near zero)
+SEQUENCE_MIN_BELIEF = 0.1
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".fuo_cache")
+SEQUENCE_CACHE = os.path.join(CACHE_DIR, "sequencing_v2.json")
+DX_INDEX = {d["dx"]: i for i, d in enumerate(DISEASES)}
+
+def binary_entropy(p):
+    if p <= 0 or p >= 1:
+        return 0.0
+    return -(p * math.log2(p) + (1 - p) * math.log2(1 - p))
+
+def test_splits(signature):
+    # Each order is part of some diagnoses' workup but not others, so it
+    # splits the differential; this is the belief-independent part that
+    # gets precomputed: (order, best tier, diagnoses that order it).
+    candidates = {}
+    for i in signature:
+        for order, tier in DISEASES[i]["orders"]:
+            best_tier, members = candidates.get(order, (tier, ()))
+            candidates[order] = (min(best_tier, tier), members + (i,))
+    return [[order, tier, list(members)] for order, (tier, members) in candidates.items()]
+
+def rank_tests(splits, belief):
+    # belief: dx index -> weight over the signature. An order's expected
+    # information gain is the entropy of the belief mass on its side; ties
+    # (entropy is symmetric) go to the lower tier, then the larger mass.
+    total = sum(belief.values())
+    scored = []
+    for order, tier, members in splits:
+        mass = sum(belief[i] for i in members) / total
+        scored.append((-round(binary_entropy(mass), 4), tier, -mass, order, len(members)))
+    scored.sort()
+    return [(order, tier, -value, hits) for value, tier, _, order, hits in scored]
+
+def kb_fingerprint():
+    kb = [(d["dx"], d["orders"]) for d in DISEASES]
+    return hashlib.sha1(json.dumps(kb).encode("utf-8")).hexdigest()
+
+def signature_key(signature):
+    return ".".join(map(str, signature))
+
+def build_sequencing_table(top_n=SEQUENCE_TOP_N):
+    table = {}
+    for size in range(1, top_n + 1):
+        for signature in itertools.combinations(range(len(DISEASES)), size):
+            table[signature_key(signature)] = test_splits(signature)
+    return table
+
+def write_sequencing_table(path=SEQUENCE_CACHE):
+    table = build_sequencing_table()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as fh:
+        json.dump({"kb": kb_fingerprint(), "top_n": SEQUENCE_TOP_N, "table": table}, fh)
+    return table
+
+@st.cache_resource
+def load_sequencing_table():
+    fingerprint = kb_fingerprint()
+    try:
+        with open(SEQUENCE_CACHE) as fh:
+            cached = json.load(fh)
+        if cached["kb"] == fingerprint and cached["top_n"] == SEQUENCE_TOP_N:
+            return cached["table"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    # Normally written at deploy time by build_sequencing.py; building here
+    # keeps a fresh checkout working
+    try:
+        return write_sequencing_table()
+    except OSError:
+        return build_sequencing_table()
+
+def sequence_orders(active, prior_neg):
+    if not active:
+        return []
+
+    top = active[:SEQUENCE_TOP_N]
+    signature = tuple(sorted(DX_INDEX[d["dx"]] for d in top))
+    splits = load_sequencing_table().get(signature_key(signature)) or test_splits(signature)
+    # Belief follows the differential's scores, so a test that only the
+    # weakest diagnosis orders ranks below one the leading diagnosis orders
+    belief = {DX_INDEX[d["dx"]]: max(d["score"], SEQUENCE_MIN_BELIEF) for d in top}
+    ranked = rank_tests(splits, belief)
+
+    already_done = done_orders(prior_neg)
+    return [r for r in ranked if not is_done(r[0], already_done)]
 
-    lines = []
-    lines.append(f"Date: {today}")
-    # Immune-status descriptor for note
-    immune_text = ""
-    
+
+# ================================================================
+# CASE TIMELINE (dated events, incremental re-planning)
+# ================================================================
+
+TIMELINE_DIR = os.path.join(CACHE_DIR, "timelines")
+TIMELINE_MAGIC = b"FUOT"
+TIMELINE_HEADER = struct.Struct("<4sBH")   # magic, version, baseline JSON length
+TIMELINE_EVENT = struct.Struct("<IBB")     # date ordinal, kind, label length
+TIMELINE_VERSION = 1
+
+EVENT_FINDING = 1
+EVENT_RESOLVED = 2
+EVENT_RESULT = 3
+EVENT_KINDS = {
+    EVENT_FINDING: "New finding",
+    EVENT_RESOLVED: "Finding resolved",
+    EVENT_RESULT: "Negative result"
+}
+
+def compile_trigger_index():
+    index = {}
+    for i, d in enumerate(DISEASES):
+        for t in d["triggers"]:
+            index.setdefault(t, []).append(i)
+    return index
+
+TRIGGER_INDEX = compile_trigger_index()
+NEURO_DX = [i for i, d in enumerate(DISEASES) if d.get("requires_neuro")]
+
+class CaseTimeline:
+    # Keeps per-diagnosis scores and refcounted order tiers so each event
+    # only revisits the diagnoses its finding triggers (plus neuro-gated
+    # ones when the neuro flag flips) and the orders its result suppresses.
+
+    def __init__(self, patient_id, baseline):
+        self.patient_id = patient_id
+        self.baseline = baseline
+        self.events = []
+        self.findings = set(baseline["positives"])
+        self.positives = expand_positives(baseline)
+        self.prior_neg = list(baseline["prior_neg"])
+        self.done = done_orders(self.prior_neg)
+        self.boosts = [transplant_boost(d, baseline) for d in DISEASES]
+        self.scores = [
+            sum(t in self.positives for t in d["triggers"]) + bool(self.boosts[i])
+            for i, d in enumerate(DISEASES)
+        ]
+        self.active = set()
+        self.order_refs = collections.Counter()
+        self.tiers = {0: set(), 1: set(), 2: set(), 3: set()}
+        self.last_diff = None
+
+        for order in BASELINE_ORDERS:
+            self.ref_order(order, 0, 1)
+        self.refresh(range(len(DISEASES)))
+
+    def ref_order(self, order, tier, delta):
+        refs = self.order_refs[order, tier] + delta
+        self.order_refs[order, tier] = refs
+        if refs == 0:
+            self.tiers[tier].discard(order)
+        elif refs == 1 and delta > 0 and not is_done(order, self.done):
+            self.tiers[tier].add(order)
+
+    def refresh(self, indices):
+        for i in indices:
+            d = DISEASES[i]
+            on = self.scores[i] > 0 and not failed_gate(d, self.baseline, self.positives)
+            if on == (i in self.active):
+                continue
+            if on:
+                self.active.add(i)
+            else:
+                self.active.discard(i)
+            for order, tier in d["orders"]:
+                self.ref_order(order, tier, 1 if on else -1)
+
+    def set_finding(self, label, present):
+        if (label in self.findings) == present:
+            return
+        neuro_before = neuro_flag(self.positives)
+        was_positive = label in self.positives
+        if present:
+            self.findings.add(label)
+            self.positives.add(label)
+        else:
+            self.findings.discard(label)
+            self.positives = expand_positives(self.inputs())
+
+        # Derived findings (e.g. HIV from immune status) are already scored
+        if (label in self.positives) == was_positive:
+            return
+
+        touched = TRIGGER_INDEX.get(label, [])
+        for i in touched:
+            self.scores[i] += 1 if present else -1
+        if neuro_flag(self.positives) != neuro_before:
+            touched = set(touched).union(NEURO_DX)
+        self.refresh(touched)
+
+    def add_result(self, label):
+        if label in self.prior_neg:
+            return
+        self.prior_neg.append(label)
+        newly_done = set(PRIOR_MAP.get(label, [])) - self.done
+        self.done |= newly_done
+        for orders in self.tiers.values():
+            orders.difference_update([o for o in orders if is_done(o, newly_done)])
+
+    def apply(self, date, kind, label, diff=True):
+        before = self.snapshot() if diff else None
+        if kind == EVENT_RESULT:
+            self.add_result(label)
+        else:
+            self.set_finding(label, kind == EVENT_FINDING)
+        self.events.append((date, kind, label))
+        if diff:
+            self.last_diff = plan_diff(before, self.snapshot())
+
+    def snapshot(self):
+        return (
+            {DISEASES[i]["dx"]: self.scores[i] for i in self.active},
+            {tier: set(orders) for tier, orders in self.tiers.items()}
+        )
+
+    def inputs(self):
+        inputs = dict(self.baseline)
+        inputs["positives"] = [f for f in FINDING_VOCAB if f in self.findings]
+        inputs["prior_neg"] = list(self.prior_neg)
+        return inputs
+
+    def plan(self):
+        active = []
+        for i in sorted(self.active):
+            d = DISEASES[i]
+            reasons = [t for t in d["triggers"] if t in self.positives]
+            if self.boosts[i]:
+                reasons.append(self.boosts[i])
+            active.append({
+                "dx": d["dx"],
+                "cat": d["cat"],
+                "score": self.scores[i],
+                "reasons": reasons,
+                "orders": d["orders"]
+            })
+        active.sort(key=lambda x: x["score"], reverse=True)
+        return active, {tier: set(orders) for tier, orders in self.tiers.items()}
+
+def plan_diff(before, after):
+    scores_before, tiers_before = before
+    scores_after, tiers_after = after
+    return {
+        "added": sorted(dx for dx in scores_after if dx not in scores_before),
+        "removed": sorted(dx for dx in scores_before if dx not in scores_after),
+        "rescored": sorted(
+            (dx, scores_before[dx], scores_after[dx]) for dx in scores_after
+            if dx in scores_before and scores_before[dx] != scores_after[dx]
+        ),
+        "orders_added": {t: sorted(tiers_after[t] - tiers_before[t]) for t in tiers_after if tiers_after[t] - tiers_before[t]},
+        "orders_removed": {t: sorted(tiers_before[t] - tiers_after[t]) for t in tiers_after if tiers_before[t] - tiers_after[t]}
+    }
+
+def format_plan_diff(diff):
+    headers = dict(NOTE_TIERS)
+    lines = [f"+ {short_name(dx)}" for dx in diff["added"]]
+    lines += [f"− {short_name(dx)}" for dx in diff["removed"]]
+    lines += [f"{short_name(dx)}: score {old} → {new}" for dx, old, new in diff["rescored"]]
+    for tier, orders in diff["orders_added"].items():
+        lines += [f"+ {o} ({headers[tier].rstrip(':')})" for o in orders]
+    for tier, orders in diff["orders_removed"].items():
+        lines += [f"− {o} ({headers[tier].rstrip(':')})" for o in orders]
+    return lines
+
+class TimelineStore:
+    # Append-only binary logs on disk, one per patient; loaded timelines
+    # are cached and caught up from the file tail when it grows.
+
+    def __init__(self, root=TIMELINE_DIR):
+        self.root = root
+        self.lock = threading.RLock()
+        self.loaded = {}
+
+    def path(self, patient_id):
+        # Rejected rather than stripped, so "A/1" and "A1" cannot share a log
+        if not patient_id or not all(c.isalnum() or c in "-_" for c in patient_id):
+            raise ValueError(f"Patient ID {patient_id!r} may only contain letters, digits, '-' and '_'")
+        return os.path.join(self.root, f"{patient_id}.fuot")
+
+    def patient_ids(self):
+        try:
+            return sorted(f[:-5] for f in os.listdir(self.root) if f.endswith(".fuot"))
+        except OSError:
+            return []
+
+    def create(self, patient_id, baseline):
+        base = json.dumps(baseline, separators=(",", ":")).encode("utf-8")
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path(patient_id)
+        with self.lock:
+            try:
+                fh = open(path, "xb")
+            except FileExistsError:
+                # Another session or worker started this patient first
+                return self.get(patient_id)
+            with fh:
+                fh.write(TIMELINE_HEADER.pack(TIMELINE_MAGIC, TIMELINE_VERSION, len(base)) + base)
+            timeline = CaseTimeline(patient_id, baseline)
+            self.loaded[patient_id] = (os.path.getsize(path), timeline)
+        return timeline
+
+    def append(self, patient_id, date, kind, label):
+        if kind == EVENT_RESULT and label not in PRIOR_INDEX:
+            raise ValueError(f"{label!r} is not a test result")
+        if kind != EVENT_RESULT and label not in FINDING_INDEX:
+            raise ValueError(f"{label!r} is not a finding")
+
+        timeline = self.get(patient_id)
+        if timeline is None:
+            raise ValueError(f"No timeline for {patient_id!r}")
+        data = label.encode("utf-8")
+        path = self.path(patient_id)
+        with self.lock:
+            with open(path, "ab") as fh:
+                fh.write(TIMELINE_EVENT.pack(date.toordinal(), kind, len(data)) + data)
+            timeline.apply(date, kind, label)
+            self.loaded[patient_id] = (os.path.getsize(path), timeline)
+        return timeline
+
+    def get(self, patient_id):
+        path = self.path(patient_id)
+        with self.lock:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                return None
+            cached = self.loaded.get(patient_id)
+            if cached and cached[0] == size:
+                return cached[1]
+
+            try:
+                with open(path, "rb") as fh:
+                    if cached and cached[0] < size:
+                        timeline, offset = cached[1], cached[0]
+                        fh.seek(offset)
+                    else:
+                        timeline, offset = self.read_header(patient_id, fh), fh.tell()
+                    self.replay(timeline, fh.read())
+            except (struct.error, KeyError, TypeError, ValueError) as exc:
+                # A half-replayed cache entry would double-apply on retry
+                self.loaded.pop(patient_id, None)
+                detail = f"missing field {exc}" if isinstance(exc, KeyError) else exc
+                raise ValueError(f"Damaged timeline file for {patient_id!r}: {detail}") from None
+            self.loaded[patient_id] = (size, timeline)
+            return timeline
+
+    def view(self, patient_id):
+        # Plan, last change and events copied out together under the lock,
+        # so a concurrent append cannot mutate them mid-read
+        with self.lock:
+            timeline = self.get(patient_id)
+            if timeline is None:
+                return None
+            active, orders = timeline.plan()
+            return active, orders, timeline.last_diff, list(timeline.events)
+
+    def read_header(self, patient_id, fh):
+        header = fh.read(TIMELINE_HEADER.size)
+        if len(header) < TIMELINE_HEADER.size:
+            raise ValueError("truncated header")
+        magic, version, length = TIMELINE_HEADER.unpack(header)
+        if magic != TIMELINE_MAGIC or version != TIMELINE_VERSION:
+            raise ValueError(f"Unsupported timeline file for {patient_id!r}")
+        base = fh.read(length)
+        if len(base) < length:
+            raise ValueError("truncated baseline")
+        return CaseTimeline(patient_id, json.loads(base))
+
+    def replay(self, timeline, data):
+        events = []
+        offset = 0
+        while offset + TIMELINE_EVENT.size <= len(data):
+            ordinal, kind, length = TIMELINE_EVENT.unpack_from(data, offset)
+            offset += TIMELINE_EVENT.size
+            events.append((datetime.date.fromordinal(ordinal), kind, data[offset:offset + length].decode("utf-8")))
+            offset += length
+        # Only the newest event needs a diff against the plan before it
+        for n, event in enumerate(events, 1):
+            timeline.apply(*event, diff=n == len(events))
+
+@st.cache_resource
+def timeline_store():
+    return TimelineStore()
+
+
+# ================================================================
+# WARD CENSUS (background re-scoring into a shared table)
+# ================================================================
+
+CENSUS_INTERVAL = float(os.environ.get("FUO_CENSUS_INTERVAL", 15))
+CENSUS_PAGE_SIZES = [25, 50, 100]
+
+def census_row(patient_id, active, orders, n_events):
+    outstanding = [o for tier in (1, 2, 3) for o in ordered_tier(orders, tier)]
+    top = active[0] if active else None
+    return {
+        "patient": patient_id,
+        "top_dx": short_name(top["dx"]) if top else "",
+        "score": top["score"] if top else 0,
+        "categories": sorted({d["cat"] for d in active}, key=CAT_ORDER.index),
+        "differential": ", ".join(short_name(d["dx"]) for d in active[1:4]),
+        "outstanding": len(outstanding),
+        "next_orders": "; ".join(outstanding[:4]),
+        "events": n_events,
+        "updated": datetime.datetime.now().strftime("%H:%M:%S"),
+        "error": ""
+    }
+
+def census_error_row(patient_id, exc):
+    # Shown instead of dropping the patient, so a bad timeline is visible
+    return {
+        "patient": patient_id,
+        "top_dx": "⚠ cannot score",
+        "score": 0,
+        "categories": [],
+        "differential": "",
+        "outstanding": 0,
+        "next_orders": "",
+        "events": 0,
+        "updated": datetime.datetime.now().strftime("%H:%M:%S"),
+        "error": str(exc)
+    }
+
+class CensusScheduler:
+    # Re-scores a patient only when the fingerprint (case_key of their
+    # current timeline inputs, plus event count) changes; pages render
+    # from self.rows.
+
+    def __init__(self, store, interval=CENSUS_INTERVAL):
+        self.store = store
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.rows = {}
+        self.fingerprints = {}
+        self.last_pass = None
+        self.last_rescored = 0
+        self.last_duration = 0.0
+        self.error = None
+        self.wake = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                self.run_pass()
+                self.error = None
+            except Exception as exc:
+                self.error = exc
+            self.wake.wait(self.interval)
+            self.wake.clear()
+
+    def run_pass(self):
+        start = time.perf_counter()
+        seen = set()
+        rescored = 0
+
+        for patient_id in self.store.patient_ids():
+            try:
+                # Hold the store lock so an event appended from the UI cannot
+                # land halfway through reading the timeline's inputs
+                with self.store.lock:
+                    timeline = self.store.get(patient_id)
+                    key = case_key(timeline.inputs()) if timeline else None
+                    n_events = len(timeline.events) if timeline else 0
+            except Exception as exc:
+                # Whatever is wrong with one patient's log, keep scoring the rest
+                seen.add(patient_id)
+                with self.lock:
+                    self.rows[patient_id] = census_error_row(patient_id, exc)
+                    self.fingerprints[patient_id] = None
+                continue
+            if key is None:
+                continue
+            seen.add(patient_id)
+            # The event count is part of the fingerprint: a finding added then
+            # resolved leaves the case key unchanged but the row must update
+            fingerprint = (key, n_events)
+            if self.fingerprints.get(patient_id) == fingerprint:
+                continue
+
+            active, orders = plan_for_key(key)
+            row = census_row(patient_id, active, orders, n_events)
+            with self.lock:
+                self.rows[patient_id] = row
+                self.fingerprints[patient_id] = fingerprint
+            rescored += 1
+
+        with self.lock:
+            for patient_id in set(self.rows) - seen:
+                del self.rows[patient_id]
+                del self.fingerprints[patient_id]
+            self.last_pass = datetime.datetime.now()
+            self.last_rescored = rescored
+            self.last_duration = time.perf_counter() - start
+
+    def refresh_now(self):
+        self.wake.set()
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.rows.values())
+
+def filter_census(rows, categories=(), min_score=0, search=""):
+    search = search.strip().lower()
+    return [
+        r for r in rows
+        # Error rows bypass score and category filters so they stay visible
+        if (r["error"] or (
+            r["score"] >= min_score
+            and (not categories or any(c in categories for c in r["categories"]))
+        ))
+        and (not search or search in r["patient"].lower())
+    ]
+
+@st.cache_resource
+def census_scheduler():
+    return CensusScheduler(timeline_store())
+
+
+# ================================================================
+# NOTE TEMPLATES (compiled once per process)
+# ================================================================
+
+NOTE_INTRO = (
+    "Date: {today}\n"
+    "{age} year old {sex}{immune_text} presenting with prolonged fever without a clear source.\n"
+    "Tmax {tmax} F with heart rate {hr} bpm at peak. "
+    "Fever has been present for {fever_days} days."
+)
+
+NOTE_TIERS = [
+    (0, "Baseline studies:"),
+    (1, "Targeted testing:"),
+    (2, "Imaging:"),
+    (3, "Advanced diagnostics:")
+]
+
+def compile_tier_order():
+    by_tier = {0: set(BASELINE_ORDERS), 1: set(), 2: set(), 3: set()}
+    for d in DISEASES:
+        for order, tier in d["orders"]:
+            by_tier[tier].add(order)
+    return {tier: tuple(sorted(names)) for tier, names in by_tier.items()}
+
+# Every order the engine can emit, pre-sorted per tier, so rendering a
+# note is a membership filter instead of a sort.
+TIER_ORDER = compile_tier_order()
+
+def ordered_tier(orders, tier):
+    names = orders[tier]
+    ranked = [o for o in TIER_ORDER[tier] if o in names]
+    if len(ranked) != len(names):
+        ranked = sorted(names)
+    return ranked
+
+
+# ================================================================
+# NOTE BUILDER
+# ================================================================
+
+def immune_descriptor(inputs):
     if inputs["immune"] == "HIV" and inputs["cd4"] is not None:
-        immune_text = f" with HIV (CD4 {inputs['cd4']})"
-    
-    elif inputs["immune"] == "Transplant" and inputs["transplant_type"]:
+        return f" with HIV (CD4 {inputs['cd4']})"
+
+    if inputs["immune"] == "Transplant" and inputs["transplant_type"]:
         if inputs.get("time_since_tx") is not None:
-            immune_text = (
+            return (
                 f" with {inputs['transplant_type'].lower()} transplant "
                 f"{inputs['time_since_tx']} months ago"
             )
-        else:
-            immune_text = (
-                f" with {inputs['transplant_type'].lower()} transplant"
-            )
-            
-    elif inputs["immune"] in ["Biologics", "Chemotherapy"]:
-        immune_text = f" on {inputs['immune'].lower()}"
+        return f" with {inputs['transplant_type'].lower()} transplant"
 
-# Final line
-    lines.append(
-        f"{age} year old {sex}{immune_text} presenting with prolonged fever without a clear source."
-    )
+    if inputs["immune"] in ["Biologics", "Chemotherapy"]:
+        return f" on {inputs['immune'].lower()}"
 
-    lines.append(
-        f"Tmax {inputs['tmax']} F with heart rate {inputs['hr']} bpm at peak. "
-        f"Fever has been present for {inputs['fever_days']} days."
-    )
+    return ""
+
+def build_note(inputs, active, orders, today=None):
+    parts = [NOTE_INTRO.format(
+        today=today or datetime.date.today().isoformat(),
+        age=inputs["age"],
+        sex=inputs["sex"],
+        immune_text=immune_descriptor(inputs),
+        tmax=inputs["tmax"],
+        hr=inputs["hr"],
+        fever_days=inputs["fever_days"]
+    )]
 
     if neuro_flag(inputs["positives"]):
-        lines.append("Neurologic symptoms present; consider CNS involvement based on overall course.")
+        parts.append("Neurologic symptoms present; consider CNS involvement based on overall course.")
 
     if has_faget(inputs["tmax"], inputs["hr"]):
-        lines.append("Relative bradycardia present.")
+        parts.append("Relative bradycardia present.")
 
     if inputs["positives"]:
-        lines.append("Features include: " + ", ".join(sorted(inputs["positives"])) + ".")
+        parts.append("Features include: " + ", ".join(sorted(inputs["positives"])) + ".")
 
     if inputs["prior_neg"]:
-        lines.append("Prior negative workup: " + ", ".join(inputs["prior_neg"]) + ".")
+        parts.append("Prior negative workup: " + ", ".join(inputs["prior_neg"]) + ".")
 
-    lines.append("")
-    lines.append("Assessment and differential:")
+    parts.append("\nAssessment and differential:")
 
-    # Category grouping
-    grouped = {}
-    for dx in active:
-        grouped.setdefault(dx["cat"], []).append(dx)
-
-    strong = [short_name(active[0]["dx"])] if active else []
+    if active:
+        parts.append(f"Most consistent with {short_name(active[0]['dx'])} based on current findings.")
     possible = [short_name(d["dx"]) for d in active[1:4]]
     unlikely = [short_name(d["dx"]) for d in active[4:8]]
-
-    if strong:
-        lines.append(f"Most consistent with {strong[0]} based on current findings.")
     if possible:
-        lines.append(f"Other possible etiologies include: {', '.join(possible)}.")
+        parts.append(f"Other possible etiologies include: {', '.join(possible)}.")
     if unlikely:
-        lines.append(f"Less likely considerations: {', '.join(unlikely)}.")
-
-    lines.append("")
-    lines.append("Plan:")
-
-    # TIER 0
-    lines.append("Baseline studies:")
-    for o in sorted(orders[0]):
-        lines.append(f"- [ ] {o}")
-
-    # TIER 1
-    if orders[1]:
-        lines.append("")
-        lines.append("Targeted testing:")
-        for o in sorted(orders[1]):
-            lines.append(f"- [ ] {o}")
-
-    # TIER 2
-    if orders[2]:
-        lines.append("")
-        lines.append("Imaging:")
-        for o in sorted(orders[2]):
-            lines.append(f"- [ ] {o}")
-
-    # TIER 3
-    if orders[3]:
-        lines.append("")
-        lines.append("Advanced diagnostics:")
-        for o in sorted(orders[3]):
-            lines.append(f"- [ ] {o}")
-
-    return "\n".join(lines)
+        parts.append(f"Less likely considerations: {', '.join(unlikely)}.")
+
+    parts.append("\nPlan:")
+
+    for tier, header in NOTE_TIERS:
+        ranked = ordered_tier(orders, tier)
+        # Baseline header is always printed; later tiers only when populated
+        if tier and not ranked:
+            continue
+        block = header if not tier else "\n" + header
+        parts.append("\n".join([block] + [f"- [ ] {o}" for o in ranked]))
+
+    return "\n".join(parts)
+
+
+# ================================================================
+# BULK EXPORT (clinic lists -> single archive)
+# ================================================================
+
+BULK_WORKERS = 8
+BULK_CHUNK = 64
+BULK_FORMATS = {"zip": ".zip", "tar.gz": ".tar.gz"}
+BULK_SKIPPED_NAME = "SKIPPED_ROWS.txt"
+
+def split_list(value):
+    return [v.strip() for v in (value or "").split(";") if v.strip()]
+
+def is_truthy(value):
+    return (value or "").strip().lower() in ("1", "true", "yes", "y")
+
+def csv_rows(csv_bytes):
+    return csv.DictReader(io.TextIOWrapper(io.BytesIO(csv_bytes), encoding="utf-8-sig"))
+
+def row_number(row, field, default, cast=int):
+    value = (row.get(field) or "").strip()
+    if not value:
+        return default
+    try:
+        return cast(value)
+    except ValueError:
+        raise ValueError(f"{field} is not a number: {value!r}") from None
+
+def row_error(n, row, exc):
+    patient_id = (row.get("patient_id") or "").strip()
+    return f"row {n}{f' ({patient_id})' if patient_id else ''}: {exc}"
+
+def case_from_row(row):
+    tmax = row_number(row, "tmax", 101.5, float)
+    hr = row_number(row, "hr", 95)
+    checked = [is_truthy(row.get(key)) for key in WIDGET_KEYS]
+    positives = assemble_positives(checked, tmax, hr)
+    positives += [p for p in split_list(row.get("positives")) if p not in positives]
+
+    return {
+        "age": row_number(row, "age", 55),
+        "sex": row.get("sex") or "Female",
+        "immune": row.get("immune") or "Immunocompetent",
+        "time_since_tx": row_number(row, "time_since_tx", None),
+        "cd4": row_number(row, "cd4", None),
+        "tmax": tmax,
+        "hr": hr,
+        "fever_days": row_number(row, "fever_days", 14),
+        "positives": positives,
+        "prior_neg": split_list(row.get("prior_neg")),
+        "on_abx": is_truthy(row.get("on_abx")),
+        "transplant_type": row.get("transplant_type") or None,
+        "ebv_status": row.get("ebv_status") or None
+    }
+
+def note_file_name(row, index):
+    pid = "".join(c for c in (row.get("patient_id") or "") if c.isalnum() or c in "-_")
+    return f"FUO_consult_{pid or f'{index + 1:05d}'}.txt"
+
+@functools.lru_cache(maxsize=4096)
+def plan_for_key(key):
+    inputs = decode_case(key)
+    active = build_differential(inputs)
+    return active, build_orders(active, inputs["prior_neg"])
+
+def render_row(index, row, today):
+    # Returns (file name, note bytes, None), or (None, None, reason) for a
+    # row that is skipped. Keying rejects findings outside the vocabulary,
+    # which would otherwise be listed in the note but never scored.
+    try:
+        inputs = case_from_row(row)
+        key = case_key(inputs)
+    except ValueError as exc:
+        return None, None, row_error(index + 2, row, exc)
+    active, orders = plan_for_key(key)
+    return note_file_name(row, index), build_note(inputs, active, orders, today).encode("utf-8"), None
+
+def open_archive(fileobj, fmt):
+    if fmt == "zip":
+        zf = zipfile.ZipFile(fileobj, "w", zipfile.ZIP_DEFLATED)
+        return zf, zf.writestr
+
+    tf = tarfile.open(fileobj=fileobj, mode="w:gz")
+    mtime = time.time()
+
+    def add(name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = mtime
+        tf.addfile(info, io.BytesIO(data))
+
+    return tf, add
+
+def export_notes(rows, fileobj, fmt="zip", workers=BULK_WORKERS, on_progress=None):
+    # Rows are consumed lazily and rendered BULK_CHUNK at a time, so only
+    # one chunk of notes is ever held in memory. Invalid rows are skipped
+    # and listed in BULK_SKIPPED_NAME; returns (rows processed, skipped).
+    today = datetime.date.today().isoformat()
+    archive, add = open_archive(fileobj, fmt)
+    done = 0
+    skipped = []
+
+    with archive, concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        rows = enumerate(rows)
+        while True:
+            chunk = list(itertools.islice(rows, BULK_CHUNK))
+            if not chunk:
+                break
+            for name, data, error in pool.map(lambda ir: render_row(ir[0], ir[1], today), chunk):
+                if error:
+                    skipped.append(error)
+                else:
+                    add(name, data)
+            done += len(chunk)
+            if on_progress:
+                on_progress(done)
+        if skipped:
+            add(BULK_SKIPPED_NAME, ("\n".join(skipped) + "\n").encode("utf-8"))
+
+    return done, skipped
+
+class BulkExportJob:
+
+    def __init__(self, csv_bytes, fmt):
+        self.fmt = fmt
+        # Count parsed records, not lines: quoted fields may span lines
+        self.total = sum(1 for _ in csv_rows(csv_bytes))
+        self.done = 0
+        self.skipped = []
+        self.error = None
+        self.finished = False
+        self.workdir = tempfile.mkdtemp(prefix="fuo_bulk_")
+        # Also removes the archive if the owning session is dropped unexported
+        self.remove_workdir = weakref.finalize(self, shutil.rmtree, self.workdir, True)
+        self.path = os.path.join(
+            self.workdir,
+            f"FUO_notes_{datetime.date.today().isoformat()}{BULK_FORMATS[fmt]}"
+        )
+        self.thread = threading.Thread(target=self.run, args=(csv_bytes,), daemon=True)
+        self.thread.start()
+
+    def run(self, csv_bytes):
+        try:
+            with open(self.path, "wb") as fh:
+                self.done, self.skipped = export_notes(
+                    csv_rows(csv_bytes), fh, self.fmt, on_progress=self.set_done
+                )
+        except Exception as exc:
+            self.error = exc
+        finally:
+            self.finished = True
+
+    def set_done(self, done):
+        self.done = done
+
+    def cleanup(self):
+        # Archives live on server disk until the next export or session expiry
+        self.remove_workdir()
+
+
+# ================================================================
+# SESSION MEMORY (per-session budgets + shared note store)
+# ================================================================
+
+SESSION_BUDGET_KB = int(os.environ.get("FUO_SESSION_BUDGET_KB", 512))
+NOTE_STORE_MB = int(os.environ.get("FUO_NOTE_STORE_MB", 32))
+SESSION_IDLE_MINUTES = int(os.environ.get("FUO_SESSION_IDLE_MINUTES", 240))
+
+def approx_size(value, depth=3):
+    size = sys.getsizeof(value)
+    if isinstance(value, io.BytesIO):
+        # UploadedFile shares its bytes copy-on-write, which getsizeof leaves
+        # out (and getbuffer() would force a copy); .size is the upload length
+        size = max(size, getattr(value, "size", 0))
+    elif depth and isinstance(value, dict):
+        size += sum(approx_size(k, depth - 1) + approx_size(v, depth - 1) for k, v in value.items())
+    elif depth and isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(approx_size(v, depth - 1) for v in value)
+    return size
+
+# Session-state keys holding large artifacts; cleared when a session goes
+# over budget or idles out
+SESSION_LARGE_KEYS = ["bulk_job", "ui_bulk_csv", "ui_census_csv"]
+
+def current_session():
+    # The per-session state object (not the st.session_state proxy) so the
+    # memory manager can clear it later from another session's thread
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return "local", st.session_state
+    return ctx.session_id, ctx.session_state
+
+def session_state_dict(state):
+    if hasattr(state, "filtered_state"):
+        return state.filtered_state
+    return state.to_dict()
+
+def evict_large_state(state):
+    cleared = 0
+    for key in SESSION_LARGE_KEYS:
+        if key not in state:
+            continue
+        value = state[key]
+        if isinstance(value, BulkExportJob):
+            if not value.finished:
+                continue
+            value.cleanup()
+        try:
+            del state[key]
+            cleared += 1
+        except KeyError:
+            pass
+    return cleared
+
+class SessionMemory:
+    # Sessions keep only case tokens; rendered notes live here, zlib-packed
+    # in one LRU shared by every session, and are rebuilt on a miss. Over
+    # budget or idle, a session's SESSION_LARGE_KEYS are cleared too.
+
+    def __init__(self, store_bytes, session_bytes, idle_seconds):
+        self.store_bytes = store_bytes
+        self.session_bytes = session_bytes
+        self.idle_seconds = idle_seconds
+        self.lock = threading.Lock()
+        self.notes = collections.OrderedDict()
+        self.note_owners = {}
+        self.used = 0
+        self.sessions = {}
+        self.evictions = 0
+        # Sessions whose state was garbage-collected; drained in touch()
+        self.closed = collections.deque()
+
+    def session(self, sid):
+        return self.sessions.setdefault(
+            sid, {"last_seen": time.time(), "state": 0, "notes": {}, "ref": None, "cleared": 0}
+        )
+
+    def note(self, sid, key, build):
+        with self.lock:
+            packed = self.notes.get(key)
+            if packed is not None:
+                self.notes.move_to_end(key)
+                self.own(sid, key, packed)
+                return zlib.decompress(packed).decode("utf-8")
+
+        text = build()
+        packed = zlib.compress(text.encode("utf-8"))
+        with self.lock:
+            if key not in self.notes:
+                self.notes[key] = packed
+                self.used += len(packed)
+            self.own(sid, key, packed)
+            self.compact(sid, keep=key)
+            while self.used > self.store_bytes and len(self.notes) > 1:
+                self.drop(next(iter(self.notes)))
+        return text
+
+    def own(self, sid, key, packed):
+        self.note_owners.setdefault(key, set()).add(sid)
+        self.session(sid)["notes"][key] = len(packed)
+
+    def drop(self, key):
+        self.used -= len(self.notes.pop(key))
+        for sid in self.note_owners.pop(key, ()):
+            self.sessions.get(sid, {}).get("notes", {}).pop(key, None)
+        self.evictions += 1
+
+    def release(self, sid, key):
+        owners = self.note_owners.get(key, set())
+        owners.discard(sid)
+        self.sessions[sid]["notes"].pop(key, None)
+        if not owners:
+            self.drop(key)
+
+    def footprint(self, sid):
+        info = self.sessions[sid]
+        return info["state"] + sum(info["notes"].values())
+
+    def compact(self, sid, keep=None):
+        # Over budget: let go of this session's older notes first
+        notes = self.sessions[sid]["notes"]
+        for key in [k for k in notes if k != keep]:
+            if self.footprint(sid) <= self.session_bytes:
+                break
+            self.release(sid, key)
+
+    def touch(self, sid, state):
+        now = time.time()
+        size = approx_size(session_state_dict(state))
+        with self.lock:
+            info = self.session(sid)
+            info["last_seen"] = now
+            info["state"] = size
+            if info["ref"] is None or info["ref"]() is not state:
+                # Weak, so a closed tab's uploads and jobs are not kept alive
+                # here; the callback only queues, since GC can run under our lock
+                info["ref"] = weakref.ref(state, lambda _, sid=sid: self.closed.append(sid))
+            self.compact(sid)
+            over_budget = self.footprint(sid) > self.session_bytes
+
+            while self.closed:
+                self.forget(self.closed.popleft())
+            idle = [s for s, i in self.sessions.items() if now - i["last_seen"] > self.idle_seconds]
+            idle_refs = [self.sessions[s]["ref"] for s in idle]
+            for s in idle:
+                self.forget(s)
+
+        # Session state is cleared outside our lock; it takes its own
+        if over_budget:
+            cleared = evict_large_state(state)
+            if cleared:
+                size = approx_size(session_state_dict(state))
+                with self.lock:
+                    if sid in self.sessions:
+                        self.sessions[sid]["state"] = size
+                        self.sessions[sid]["cleared"] += cleared
+
+        for ref in idle_refs:
+            idle_state = ref() if ref is not None else None
+            if idle_state is not None:
+                evict_large_state(idle_state)
+
+    def forget(self, sid):
+        info = self.sessions.get(sid)
+        if info is None:
+            return
+        for key in list(info["notes"]):
+            self.release(sid, key)
+        del self.sessions[sid]
+
+    def metrics(self):
+        now = time.time()
+        with self.lock:
+            return [
+                {
+                    "session": sid[:8],
+                    "footprint_kb": round(self.footprint(sid) / 1024, 1),
+                    "state_kb": round(info["state"] / 1024, 1),
+                    "notes": len(info["notes"]),
+                    "cleared_keys": info["cleared"],
+                    "idle_min": round((now - info["last_seen"]) / 60, 1)
+                }
+                for sid, info in self.sessions.items()
+            ]
+
+@st.cache_resource
+def session_memory():
+    return SessionMemory(
+        NOTE_STORE_MB * 2**20,
+        SESSION_BUDGET_KB * 1024,
+        SESSION_IDLE_MINUTES * 60
+    )
+
+
+# ================================================================
+# VIEW SELECTOR + WARD CENSUS PAGE
+# ================================================================
+
+view = st.sidebar.radio("View", ["Consult", "Ward census"], key="ui_view", horizontal=True)
+
+def import_census(csv_bytes):
+    # All-or-nothing: every row is validated before any timeline is started.
+    # Returns (created, existing, errors); errors are "row N: reason".
+    store = timeline_store()
+    cases, errors = {}, []
+    for n, row in enumerate(csv_rows(csv_bytes), 2):
+        patient_id = (row.get("patient_id") or "").strip()
+        try:
+            if not patient_id:
+                raise ValueError("missing patient_id")
+            if patient_id in cases:
+                raise ValueError("duplicate patient_id")
+            store.path(patient_id)
+            inputs = case_from_row(row)
+            # Only cases the timeline log can encode are accepted, so the
+            # census pass never meets an unknown finding or test result
+            case_key(inputs)
+        except ValueError as exc:
+            errors.append(row_error(n, row, exc))
+            continue
+        cases[patient_id] = inputs
+
+    if errors:
+        return 0, 0, errors
+    created = existing = 0
+    for patient_id, inputs in cases.items():
+        if store.get(patient_id) is None:
+            store.create(patient_id, inputs)
+            created += 1
+        else:
+            existing += 1
+    return created, existing, []
+
+if view == "Ward census":
+    census = census_scheduler()
+    st.title("ID-CDSS | Ward Census")
+
+    with st.sidebar:
+        st.header("Filters")
+        census_cats = st.multiselect("Category", CAT_ORDER, key="ui_census_cats")
+        census_min = st.slider("Minimum top score", 0, 5, 1, key="ui_census_min")
+        census_search = st.text_input("Patient ID contains", key="ui_census_search")
+        census_page_size = st.selectbox("Rows per page", CENSUS_PAGE_SIZES, key="ui_census_page_size")
+
+        if st.button("Re-score now", key="btn_census_refresh"):
+            census.refresh_now()
+
+        with st.expander("Import census (CSV)"):
+            st.caption("Same columns as bulk export; rows need a patient_id. Starts a timeline per new patient.")
+            census_csv = st.file_uploader("Census list", type=["csv"], key="ui_census_csv")
+            if st.button("Import", key="btn_census_import", disabled=census_csv is None):
+                try:
+                    created, existing, errors = import_census(census_csv.getvalue())
+                except ValueError as exc:
+                    st.error(f"Census import failed: {exc}")
+                else:
+                    if errors:
+                        st.error(
+                            f"Nothing imported; fix {len(errors)} rows and re-upload.\n\n"
+                            + "\n".join(f"- {e}" for e in errors[:20])
+                        )
+                    else:
+                        st.success(f"Started {created} timelines.")
+                        if existing:
+                            st.info(f"{existing} patients already had a timeline.")
+                census.refresh_now()
+
+    @st.fragment(run_every=max(CENSUS_INTERVAL, 5))
+    def census_table():
+        rows = census.snapshot()
+        shown = filter_census(rows, census_cats, census_min, census_search)
+        shown.sort(key=lambda r: (not r["error"], -r["score"], r["patient"]))
+
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("Patients", len(rows))
+        m2.metric("Matching filters", len(shown))
+        m3.metric("Re-scored last pass", census.last_rescored)
+        m4.metric("Last pass", f"{census.last_duration * 1000:.0f} ms")
+        if census.error:
+            st.error(f"Census pass failed: {census.error}")
+        unscored = sum(1 for r in rows if r["error"])
+        if unscored:
+            st.warning(f"{unscored} patients could not be scored; see the error column.")
+        if census.last_pass:
+            st.caption(f"Last pass {census.last_pass:%H:%M:%S}; refreshes every {CENSUS_INTERVAL:g} s.")
+
+        pages = max(1, -(-len(shown) // census_page_size))
+        page = st.number_input("Page", 1, pages, 1, key="ui_census_page") if pages > 1 else 1
+        start = (page - 1) * census_page_size
+
+        st.dataframe(
+            [
+                dict(r, score=dots(r["score"]), categories=", ".join(r["categories"]))
+                for r in shown[start:start + census_page_size]
+            ],
+            hide_index=True
+        )
+
+    census_table()
+    st.stop()
+
+
+# ================================================================
+# SHARED CASE TOKENS — ?case=<token> reopens a consult
+# ================================================================
+
+def restore_case(inputs):
+    state = st.session_state
+    state["ui_age"] = inputs["age"]
+    state["ui_sex"] = inputs["sex"]
+    state["ui_immune"] = inputs["immune"]
+    if inputs["cd4"] is not None:
+        state["ui_cd4"] = inputs["cd4"]
+    if inputs["transplant_type"]:
+        state["ui_tx_type"] = inputs["transplant_type"]
+    if inputs["time_since_tx"] is not None:
+        state["ui_tx_months"] = inputs["time_since_tx"]
+    if inputs["ebv_status"]:
+        state["ui_ebv"] = inputs["ebv_status"]
+    state["ui_tmax"] = inputs["tmax"]
+    state["ui_hr"] = inputs["hr"]
+    state["ui_fever_days"] = inputs["fever_days"]
+    state["ui_on_abx"] = inputs["on_abx"]
+
+    positives = set(inputs["positives"])
+    for key, findings in WIDGET_FINDINGS.items():
+        # A widget is on when its primary finding is present
+        state[key] = findings[0] in positives
+
+    # Relative bradycardia derived from Tmax/HR is recomputed on each run;
+    # restoring it onto the manual checkbox would pin it after HR changes
+    if has_faget(inputs["tmax"], inputs["hr"]):
+        state["ui_relbrady"] = False
+    state["ui_priorneg"] = inputs["prior_neg"]
+
+# Numeric defaults are seeded through session state rather than widget
+# arguments, so a shared case can override them without a Streamlit warning
+UI_DEFAULTS = {
+    "ui_age": 55,
+    "ui_cd4": 300,
+    "ui_tx_months": 12,
+    "ui_tmax": 101.5,
+    "ui_hr": 95,
+    "ui_fever_days": 14
+}
+for key, value in UI_DEFAULTS.items():
+    st.session_state.setdefault(key, value)
+
+shared_token = st.query_params.get("case")
+if shared_token and st.session_state.get("case_loaded") != shared_token:
+    st.session_state["case_loaded"] = shared_token
+    try:
+        restore_case(case_from_token(shared_token))
+        st.session_state["case_autorun"] = True
+    except ValueError as exc:
+        st.warning(f"Could not open shared case: {exc}")
+
+
 # ================================================================
 # SIDEBAR UI — all inputs, no duplicate keys
 # ================================================================
@@ -537,6 +2165,7 @@ with st.sidebar:
         for k in list(st.session_state.keys()):
             if k.startswith("ui_") or k.startswith("btn_"):
                 del st.session_state[k]
+        st.query_params.clear()
         st.experimental_rerun()
 
     # ------------------------------------------------------------
@@ -545,12 +2174,12 @@ with st.sidebar:
     st.header("Patient Data")
     c1, c2 = st.columns(2)
 
-    age = c1.number_input("Age", 18, 100, 55, key="ui_age")
-    sex = c2.selectbox("Sex", ["Female", "Male"], key="ui_sex")
+    age = c1.number_input("Age", 18, 100, key="ui_age")
+    sex = c2.selectbox("Sex", SEXES, key="ui_sex")
 
     immune = st.selectbox(
         "Immune status",
-        ["Immunocompetent", "HIV", "Transplant", "Biologics", "Chemotherapy"],
+        IMMUNE_STATES,
         key="ui_immune"
     )
 
@@ -560,23 +2189,23 @@ with st.sidebar:
     ebv_status = None
 
     if immune == "HIV":
-        cd4 = st.slider("CD4 count", 0, 1200, 300, key="ui_cd4")
+        cd4 = st.slider("CD4 count", 0, 1200, key="ui_cd4")
 
     if immune == "Transplant":
         with st.expander("Transplant details", expanded=True):
             transplant_type = st.selectbox(
                 "Type of transplant",
-                ["Kidney", "Liver", "Lung", "Heart", "HSCT"],
+                TRANSPLANT_TYPES,
                 key="ui_tx_type"
             )
             time_since_tx = st.number_input(
                 "Time since transplant (months)",
-                0, 600, 12,
+                0, 600,
                 key="ui_tx_months"
             )
             ebv_status = st.selectbox(
                 "EBV status",
-                ["Unknown", "Positive", "Negative"],
+                EBV_STATUSES,
                 key="ui_ebv"
             )
 
@@ -584,100 +2213,20 @@ with st.sidebar:
     # Fever profile
     # ------------------------------------------------------------
     st.header("Fever Profile")
-    tmax = st.number_input("Tmax (F)", 98.0, 107.0, 101.5, step=0.1, key="ui_tmax")
-    hr = st.number_input("Heart rate at Tmax", 40, 170, 95, key="ui_hr")
-    fever_days = st.number_input("Days of fever", 1, 365, 14, key="ui_fever_days")
+    tmax = st.number_input("Tmax (F)", 98.0, 107.0, step=0.1, key="ui_tmax")
+    hr = st.number_input("Heart rate at Tmax", 40, 170, key="ui_hr")
+    fever_days = st.number_input("Days of fever", 1, 365, key="ui_fever_days")
     on_abx = st.checkbox("On antibiotics", key="ui_on_abx")
 
     # ------------------------------------------------------------
-    # Symptoms (ROS)
-    # ------------------------------------------------------------
-    st.header("Symptoms (ROS)")
-
-    with st.expander("Constitutional", expanded=True):
-        night_sweats = st.checkbox("Night sweats", key="ui_ns")
-        weight_loss = st.checkbox("Weight loss", key="ui_wl")
-        fatigue = st.checkbox("Fatigue", key="ui_fat")
-
-    with st.expander("Neurologic", expanded=True):
-        headache = st.checkbox("Headache", key="ui_hx")
-        vision_changes = st.checkbox("Vision changes", key="ui_vc")
-        seizures = st.checkbox("Seizures", key="ui_sz")
-        jaw_claudication = st.checkbox("Jaw claudication", key="ui_jc")
-
-    with st.expander("Respiratory", expanded=True):
-        chronic_cough = st.checkbox("Chronic cough", key="ui_cc")
-        hemoptysis = st.checkbox("Hemoptysis", key="ui_hemo")
-        dyspnea = st.checkbox("Dyspnea", key="ui_dysp")
-
-    with st.expander("GI / Hepatic", expanded=True):
-        abdominal_pain = st.checkbox("Abdominal pain", key="ui_abd")
-        diarrhea = st.checkbox("Diarrhea", key="ui_diarr")
-        ruq_pain = st.checkbox("RUQ pain / hepatodynia", key="ui_ruq")
-
-    with st.expander("MSK", expanded=True):
-        arthralgia = st.checkbox("Arthralgia", key="ui_arth")
-        back_pain = st.checkbox("Back pain", key="ui_bp")
-        myalgia = st.checkbox("Myalgias", key="ui_myalg")
-
-    with st.expander("Skin findings", expanded=True):
-        rash = st.checkbox("Rash", key="ui_rash")
-        palmar_rash = st.checkbox("Palms/soles rash", key="ui_palms")
-        nodules = st.checkbox("Skin nodules/lesions", key="ui_nod")
-
-    with st.expander("Lymph / Heme", expanded=True):
-        lymphadenopathy = st.checkbox("Lymphadenopathy", key="ui_lad")
-        splenomegaly = st.checkbox("Splenomegaly", key="ui_spl")
-        pancytopenia = st.checkbox("Pancytopenia", key="ui_pan")
-
-    # ------------------------------------------------------------
-    # *** NEW: Cardiac findings ***
-    # ------------------------------------------------------------
-    with st.expander("Cardiac findings", expanded=True):
-        new_murmur = st.checkbox("New murmur", key="ui_new_murmur")
-        emboli = st.checkbox("Embolic phenomena", key="ui_emboli")
-        prosthetic_valve = st.checkbox("Prosthetic valve", key="ui_pv")
-        rel_brady_ck = st.checkbox("Relative bradycardia (manual)", key="ui_relbrady")
-
-    # ------------------------------------------------------------
-    # *** NEW: Lab abnormalities ***
-    # ------------------------------------------------------------
-    with st.expander("Lab abnormalities", expanded=True):
-        ferritin_high = st.checkbox("Ferritin > 1000", key="ui_ferritin")
-        eosinophilia = st.checkbox("Eosinophilia", key="ui_eos")
-        leukopenia = st.checkbox("Leukopenia", key="ui_leuk")
-        transaminitis = st.checkbox("Transaminitis", key="ui_trans")
-
-    # ------------------------------------------------------------
-    # *** NEW: Recent drug exposures ***
-    # ------------------------------------------------------------
-    with st.expander("Recent drug exposures", expanded=True):
-        new_beta = st.checkbox("New beta-lactam", key="ui_new_beta")
-        new_anti = st.checkbox("New anticonvulsant", key="ui_new_anti")
-        new_sulfa = st.checkbox("New sulfa", key="ui_new_sulfa")
-
-    # ------------------------------------------------------------
-    # Exposures (Animals, TB, Geography)
+    # Findings: symptoms, exam, labs, exposures (INPUT_SCHEMA)
     # ------------------------------------------------------------
-    st.header("Exposures and Risks")
-
-    with st.expander("Animals / Environment", expanded=True):
-        cats = st.checkbox("Cat exposure", key="ui_cats")
-        livestock = st.checkbox("Livestock / farm animals", key="ui_live")
-        bird_bat = st.checkbox("Bird/bat exposure", key="ui_bb")
-        unpasteurized_dairy = st.checkbox("Unpasteurized dairy", key="ui_dairy")
-        rural = st.checkbox("Rural living", key="ui_rural")
-        body_lice = st.checkbox("Body lice", key="ui_lice")
-
-    with st.expander("Social / TB Risk", expanded=True):
-        ivdu = st.checkbox("IV drug use", key="ui_ivdu")
-        homeless = st.checkbox("Homelessness/incarceration", key="ui_hl")
-        tb_contact = st.checkbox("TB exposure", key="ui_tbexp")
-        high_tb_travel = st.checkbox("High TB burden travel", key="ui_tbtravel")
-
-    with st.expander("Geography", expanded=True):
-        missouri = st.checkbox("Missouri / Ohio River Valley", key="ui_mo")
-        sw_us = st.checkbox("US Southwest travel", key="ui_swus")
+    for section, groups in INPUT_SCHEMA:
+        st.header(section)
+        for group, widgets in groups:
+            with st.expander(group, expanded=True):
+                for label, key, findings in widgets:
+                    st.checkbox(label, key=key)
 
     # ------------------------------------------------------------
     # Prior negatives
@@ -685,20 +2234,15 @@ with st.sidebar:
     st.header("Prior Workup (Negative)")
     prior_neg = st.multiselect(
         "Mark studies already done and negative",
-        [
-            "Negative blood cultures",
-            "Negative TB testing",
-            "Negative Histo antigen",
-            "Negative Bartonella serology",
-            "Negative Brucella serology",
-            "Negative HIV",
-            "Normal CT chest/abd/pelvis",
-            "Normal echocardiogram"
-        ],
+        list(PRIOR_VOCAB),
         key="ui_priorneg"
     )
 
-    run = st.button("Generate FUO Plan", key="btn_run_fuo")
+    weighted_mode = st.checkbox("Weighted likelihood-ratio scoring", key="ui_weighted")
+    sequence_mode = st.checkbox("Sequence tests by discriminative value", key="ui_sequence")
+    trace_mode = st.checkbox("Decision trace", key="ui_trace")
+
+    run = st.button("Generate FUO Plan", key="btn_run_fuo") or st.session_state.pop("case_autorun", False)
 
 
 # ================================================================
@@ -707,82 +2251,23 @@ with st.sidebar:
 
 st.title("ID-CDSS | FUO Engine v3")
 
-if run:
+memory = session_memory()
+session_id, session_state = current_session()
+memory.touch(session_id, session_state)
+
+with st.sidebar.expander("Session memory"):
+    st.caption(
+        f"Shared note store {memory.used / 1024:.1f} / {NOTE_STORE_MB * 1024} KB, "
+        f"{len(memory.notes)} notes, {memory.evictions} evictions. "
+        f"Budget {SESSION_BUDGET_KB} KB per session, idle expiry {SESSION_IDLE_MINUTES} min."
+    )
+    st.dataframe(memory.metrics(), hide_index=True)
 
-    positives = []
-
-    # ROS
-    if night_sweats: positives.append("Night sweats")
-    if weight_loss: positives.append("Weight loss")
-    if fatigue: positives.append("Fatigue")
-
-    if headache: positives.append("Headache")
-    if vision_changes: positives.append("Vision changes")
-    if seizures: positives.append("Seizures")
-    if jaw_claudication: positives.append("Jaw claudication")
-
-    if chronic_cough: positives.append("Chronic cough")
-    if hemoptysis: positives.append("Hemoptysis")
-    if dyspnea: positives.append("Dyspnea")
-
-    if abdominal_pain: positives.append("Abdominal pain")
-    if diarrhea: positives.append("Diarrhea")
-    if ruq_pain: positives.append("RUQ pain / hepatodynia")
-
-    if arthralgia: positives.append("Arthralgia")
-    if back_pain: positives.append("Back pain")
-    if myalgia: positives.append("Myalgias")
-
-    if rash: positives.append("Rash")
-    if palmar_rash: positives.append("Palms/soles rash")
-    if nodules: positives.append("Skin nodules/lesions")
-
-    if lymphadenopathy: positives.append("Lymphadenopathy")
-    if splenomegaly: positives.append("Splenomegaly")
-    if pancytopenia: positives.append("Pancytopenia")
-
-    # Cardiac
-    if new_murmur: positives.append("New murmur")
-    if emboli: positives.append("Embolic phenomena")
-    if prosthetic_valve: positives.append("Prosthetic valve")
-    if rel_brady_ck: positives.append("Relative bradycardia")
-
-    # Lab abnormalities
-    if ferritin_high: positives.append("Ferritin > 1000")
-    if eosinophilia: positives.append("Eosinophilia")
-    if leukopenia: positives.append("Leukopenia")
-    if transaminitis: positives.append("Transaminitis")
-
-    # Drug exposures
-    if new_beta: positives.append("New beta-lactam")
-    if new_anti: positives.append("New anticonvulsant")
-    if new_sulfa: positives.append("New sulfa")
-
-    # Exposures
-    if cats: positives.append("Cats")
-    if livestock:
-        positives.append("Livestock exposure")
-        positives.append("Farm animals")
-    if bird_bat: positives.append("Bird/bat exposure")
-    if unpasteurized_dairy: positives.append("Unpasteurized dairy")
-    if rural:
-        positives.append("Rural living")
-        positives.append("Farm animals")
-    if body_lice: positives.append("Body lice")
-
-    if ivdu: positives.append("IV drug use")
-    if homeless: positives.append("Homelessness/incarceration")
-    if tb_contact: positives.append("TB exposure")
-    if high_tb_travel: positives.append("High TB burden travel")
-
-    if missouri: positives.append("Missouri/Ohio River Valley")
-    if sw_us: positives.append("US Southwest travel")
+if run:
 
-    # ------------------------------------------------------------
-    # Automatic relative bradycardia trigger (Option C)
-    # ------------------------------------------------------------
-    if has_faget(tmax, hr) and "Relative bradycardia" not in positives:
-        positives.append("Relative bradycardia")
+    positives = assemble_positives(
+        [st.session_state[key] for key in WIDGET_KEYS], tmax, hr
+    )
 
     # ------------------------------------------------------------
     # Build engine inputs
@@ -803,8 +2288,15 @@ if run:
         "ebv_status": ebv_status
     }
 
-    active = build_differential(inputs)
-    orders = build_orders(active, prior_neg)
+    tracer = decision_tracer()
+    trace = tracer.start(force=trace_mode)
+    active = build_differential(inputs, weighted=weighted_mode, trace=trace)
+    orders = build_orders(active, prior_neg, trace=trace)
+
+    token = case_token(inputs)
+    tracer.finish(trace, token, session_id)
+    st.session_state["case_loaded"] = token
+    st.query_params["case"] = token
 
     # ------------------------------------------------------------
     # SAFETY FLAGS
@@ -833,8 +2325,7 @@ if run:
         if not active:
             st.write("No specific FUO syndromes triggered.")
         else:
-            cat_order = ["Infectious", "Endemic", "Immunocompromised", "Rheumatologic", "Malignancy", "Noninfectious"]
-            grouped = {cat: [] for cat in cat_order}
+            grouped = {cat: [] for cat in CAT_ORDER}
 
             for dx in active:
                 grouped[dx["cat"]].append(dx)
@@ -848,16 +2339,20 @@ if run:
                 "Noninfectious": "noninf"
             }
 
-            for cat in cat_order:
+            for cat in CAT_ORDER:
                 if grouped[cat]:
                     st.markdown(f"### {cat}")
                     for dx in grouped[cat]:
                         cls = css_map[dx["cat"]]
+                        score_text = dots(dx["score"])
+                        if weighted_mode:
+                            # Dots round and cap at 5; show the weighted score itself
+                            score_text += f" {dx['score']:.1f}"
 
                         st.markdown(
                             f"<div class='dx-block {cls}'>"
                             f"<b>{dx['dx']}</b>"
-                            f"<span class='score-dots'>{dots(dx['score'])}</span>"
+                            f"<span class='score-dots'>{score_text}</span>"
                             f"<br>Triggers: {', '.join(dx['reasons'])}"
                             f"</div>",
                             unsafe_allow_html=True
@@ -867,10 +2362,26 @@ if run:
     # Workup + note
     # ------------------------------------------------------------
     with col2:
-        note_text = build_note(inputs, active, orders)
+        if sequence_mode:
+            st.subheader("Suggested Test Sequence")
+            top = len(active[:SEQUENCE_TOP_N])
+            # With one diagnosis no test splits anything; value would be 0
+            st.markdown("\n".join(
+                f"{i}. {order} — ordered for {hits} of top {top}"
+                + (f" (value {value:.2f})" if top > 1 else "")
+                for i, (order, tier, value, hits) in enumerate(sequence_orders(active, prior_neg), 1)
+            ) or "No further targeted tests.")
+
+        note_text = memory.note(
+            session_id,
+            (token, datetime.date.today().isoformat(), weighted_mode),
+            lambda: build_note(inputs, active, orders)
+        )
 
         st.subheader("Consult Note Draft")
-        st.text_area("Note", note_text, height=380, key="ui_note_text")
+        # Read-only block rather than a text_area, so the note is not also
+        # held as widget state in every session
+        st.code(note_text, language=None, wrap_lines=True, height=380)
 
         st.download_button(
             "Download note as .txt",
@@ -879,3 +2390,157 @@ if run:
             mime="text/plain",
             key="btn_download_note"
         )
+
+        if trace is not None and trace_mode:
+            with st.expander(f"Decision trace ({len(trace.events)} events)"):
+                if trace.dropped:
+                    st.caption(f"{trace.dropped} events dropped past the {trace.limit}-event cap.")
+                st.dataframe(
+                    [{"kind": k, "subject": sub, "detail": str(d)} for k, sub, d in trace.events],
+                    hide_index=True
+                )
+                own_traces = tracer.retained(session_id)
+                st.download_button(
+                    f"Export this session's {len(own_traces)} traces (.jsonl)",
+                    data=tracer.export_jsonl(session_id),
+                    file_name=f"FUO_traces_{datetime.date.today().isoformat()}.jsonl",
+                    mime="application/jsonl",
+                    key="btn_download_traces"
+                )
+                if TRACE_ADMIN:
+                    st.download_button(
+                        f"Export all {len(tracer.retained())} retained traces (.jsonl)",
+                        data=tracer.export_jsonl(),
+                        file_name=f"FUO_traces_all_{datetime.date.today().isoformat()}.jsonl",
+                        mime="application/jsonl",
+                        key="btn_download_traces_all"
+                    )
+
+        with st.expander("Share case"):
+            st.caption("Append to the app URL to reopen this consult.")
+            st.code(f"?case={token}", language=None)
+
+
+# ================================================================
+# BULK EXPORT UI — background job, polled by a fragment
+# ================================================================
+
+with st.expander("Bulk note export (clinic list)"):
+    st.caption(
+        "CSV columns: patient_id, age, sex, immune, cd4, transplant_type, time_since_tx, "
+        "ebv_status, tmax, hr, fever_days, on_abx, positives, prior_neg "
+        "(list columns separated by ';'), or one 0/1 column per sidebar "
+        "checkbox key (ui_ns, ui_live, ...) instead of positives."
+    )
+    b1, b2 = st.columns([3, 1])
+    bulk_csv = b1.file_uploader("Clinic list", type=["csv"], key="ui_bulk_csv")
+    bulk_fmt = b2.selectbox("Archive", list(BULK_FORMATS), key="ui_bulk_fmt")
+
+    if st.button("Export notes", key="btn_bulk_export", disabled=bulk_csv is None):
+        previous = st.session_state.get("bulk_job")
+        if previous is not None:
+            previous.cleanup()
+        st.session_state["bulk_job"] = BulkExportJob(bulk_csv.getvalue(), bulk_fmt)
+
+    def bulk_status(job):
+        if job.error:
+            st.error(f"Bulk export failed: {job.error}")
+            return
+        st.progress(
+            min(job.done / job.total, 1.0) if job.total else 1.0,
+            text=f"{job.done} / {job.total} rows"
+        )
+        if job.finished and job.skipped:
+            st.warning(
+                f"Skipped {len(job.skipped)} invalid rows (listed in {BULK_SKIPPED_NAME} "
+                "in the archive):\n\n" + "\n".join(f"- {e}" for e in job.skipped[:20])
+            )
+        if job.finished and os.path.exists(job.path):
+            with open(job.path, "rb") as fh:
+                st.download_button(
+                    f"Download {os.path.basename(job.path)}",
+                    data=fh,
+                    file_name=os.path.basename(job.path),
+                    mime="application/zip" if job.fmt == "zip" else "application/gzip",
+                    key="btn_bulk_download"
+                )
+
+    # Poll only while a job is running; once it finishes, one full rerun
+    # drops the timer so idle sessions carry no background reruns
+    @st.fragment(run_every=1)
+    def bulk_progress():
+        job = st.session_state.get("bulk_job")
+        if job is None or job.finished:
+            st.rerun()
+        bulk_status(job)
+
+    bulk_job = st.session_state.get("bulk_job")
+    if bulk_job is not None and not bulk_job.finished:
+        bulk_progress()
+    elif bulk_job is not None:
+        bulk_status(bulk_job)
+
+
+# ================================================================
+# CASE TIMELINE UI
+# ================================================================
+
+with st.expander("Case timeline"):
+    timelines = timeline_store()
+    tl_patient = st.text_input("Patient ID", key="ui_tl_patient").strip()
+
+    tl_error = False
+    try:
+        timeline = timelines.get(tl_patient) if tl_patient else None
+    except (OSError, ValueError) as exc:
+        st.error(str(exc))
+        timeline, tl_error = None, True
+
+    if tl_patient and timeline is None and not tl_error:
+        base_token = st.session_state.get("case_loaded")
+        st.caption("No timeline yet. Generate a plan, then start the timeline from it.")
+        if st.button("Start timeline from current plan", key="btn_tl_start", disabled=not base_token):
+            timeline = timelines.create(tl_patient, case_from_token(base_token))
+
+    if timeline is not None:
+        with st.form("tl_event_form", clear_on_submit=True):
+            e1, e2, e3 = st.columns([1, 1, 2])
+            event_date = e1.date_input("Date", key="ui_tl_date")
+            event_kind = e2.selectbox(
+                "Event", list(EVENT_KINDS), format_func=EVENT_KINDS.get, key="ui_tl_kind"
+            )
+            event_label = e3.selectbox(
+                "Finding or result", list(FINDING_VOCAB) + list(PRIOR_VOCAB), key="ui_tl_label"
+            )
+            if st.form_submit_button("Add event"):
+                try:
+                    timeline = timelines.append(tl_patient, event_date, event_kind, event_label)
+                except ValueError as exc:
+                    st.error(str(exc))
+
+        tl_active, tl_orders, tl_diff, tl_events = timelines.view(tl_patient)
+        t1, t2 = st.columns(2)
+
+        with t1:
+            st.markdown("**Change since previous plan**")
+            changes = format_plan_diff(tl_diff) if tl_diff else []
+            st.markdown("\n".join(f"- {c}" for c in changes) or "No change.")
+
+            st.markdown("**Current plan**")
+            st.markdown("\n".join(
+                f"- {short_name(d['dx'])} {dots(d['score'])}" for d in tl_active[:8]
+            ) or "No specific FUO syndromes triggered.")
+            for tier, header in NOTE_TIERS[1:]:
+                if tl_orders[tier]:
+                    st.caption(f"{header} {', '.join(ordered_tier(tl_orders, tier))}")
+
+        with t2:
+            st.markdown(f"**Events ({len(tl_events)})**")
+            st.dataframe(
+                [
+                    {"date": d.isoformat(), "event": EVENT_KINDS[k], "detail": label}
+                    for d, k, label in reversed(tl_events)
+                ],
+                hide_index=True,
+                height=300
+            )
@@ -0,0 +1,193 @@
+"""Micro-benchmarks for the FUO rule engine.
+
+    python bench.py
+    python bench.py --cases 5000 --kb-dx 10000 --kb-triggers 2000
+"""
+
+import argparse
+import os
+import random
+import time
+
+# app.py runs its Streamlit layout in bare mode on import; keep that quiet
+os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+
+import numpy as np
+
+import app
+
+
+def bench(name, fn, number, unit="call", repeat=5):
+    fn()
+    # Best of several passes, so small overhead percentages are not noise
+    per_call = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        per_call = min(per_call, (time.perf_counter() - start) / number)
+    print(f"{name:<48} {per_call * 1e6:>10.1f} us/{unit}")
+    return per_call
+
+
+# ================================================================
+# CASES
+# ================================================================
+
+def random_cases(n, seed=0):
+    rng = random.Random(seed)
+    cases = []
+    for _ in range(n):
+        immune = rng.choice(app.IMMUNE_STATES)
+        cases.append({
+            "age": rng.randint(18, 95),
+            "sex": rng.choice(app.SEXES),
+            "immune": immune,
+            "cd4": rng.randint(0, 600) if immune == "HIV" else None,
+            "transplant_type": rng.choice(app.TRANSPLANT_TYPES) if immune == "Transplant" else None,
+            "time_since_tx": None,
+            "ebv_status": rng.choice(app.EBV_STATUSES),
+            "tmax": 102.0,
+            "hr": 95,
+            "fever_days": 21,
+            "positives": rng.sample(app.FINDING_VOCAB, rng.randint(1, 8)),
+            "prior_neg": rng.sample(app.PRIOR_VOCAB, rng.randint(0, 2)),
+            "on_abx": False
+        })
+    return cases
+
+def synthetic_kb(n_dx, n_triggers, per_dx, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = [
+        dict(zip(rng.choice(n_triggers, per_dx, replace=False).tolist(), rng.normal(1.0, 0.5, per_dx)))
+        for _ in range(n_dx)
+    ]
+    return app.CSRMatrix.from_rows(rows, n_triggers)
+
+
+# ================================================================
+# UNTRACED REFERENCE (engine as it was before the trace hooks)
+# ================================================================
+
+def untraced_differential(inputs):
+    positives = app.expand_positives(inputs)
+    active = []
+
+    for d in app.DISEASES:
+        score = 0
+        reasons = []
+        for t in d["triggers"]:
+            if t in positives:
+                score += 1
+                reasons.append(t)
+
+        if app.failed_gate(d, inputs, positives):
+            continue
+
+        boost = app.transplant_boost(d, inputs)
+        if boost:
+            score += 1
+            reasons.append(boost)
+
+        if score > 0:
+            active.append({
+                "dx": d["dx"],
+                "cat": d["cat"],
+                "score": score,
+                "reasons": reasons,
+                "orders": d["orders"]
+            })
+
+    active.sort(key=lambda x: x["score"], reverse=True)
+    return active
+
+def untraced_orders(active, prior_neg):
+    orders_by_tier = {0: set(app.BASELINE_ORDERS), 1: set(), 2: set(), 3: set()}
+    for item in active:
+        for order, tier in item["orders"]:
+            orders_by_tier[tier].add(order)
+    already_done = app.done_orders(prior_neg)
+    return {
+        tier: {o for o in orders if not app.is_done(o, already_done)}
+        for tier, orders in orders_by_tier.items()
+    }
+
+def overhead(name, traced_off, reference):
+    print(f"{'  -> ' + name + ' trace-off vs untraced':<48} {(traced_off / reference - 1) * 100:>10.1f} %")
+
+
+# ================================================================
+# SUITE
+# ================================================================
+
+def main(args):
+    cases = random_cases(args.cases)
+    it = iter(range(10**9))
+
+    def next_case():
+        return cases[next(it) % len(cases)]
+
+    # The reference must agree with the engine, or the comparison is moot
+    for case in cases:
+        active = app.build_differential(case)
+        assert untraced_differential(case) == active, "untraced reference has drifted from the engine"
+        assert untraced_orders(active, case["prior_neg"]) == app.build_orders(active, case["prior_neg"])
+
+    print(f"-- bundled knowledge base ({len(app.DISEASES)} dx x {len(app.FINDING_VOCAB)} findings)")
+    ref = bench("untraced reference differential", lambda: untraced_differential(next_case()), args.cases)
+    off = bench("build_differential (unit, trace off)", lambda: app.build_differential(next_case()), args.cases)
+    overhead("differential", off, ref)
+    on = bench(
+        "build_differential (unit, trace on)",
+        lambda: app.build_differential(next_case(), trace=app.DecisionTrace()),
+        args.cases
+    )
+    print(f"{'  -> tracing cost when on':<48} {(on / off - 1) * 100:>10.1f} %")
+    bench("build_differential (weighted)", lambda: app.build_differential(next_case(), weighted=True), args.cases)
+    bench("weighted_scores only", lambda: app.weighted_scores(next_case()["positives"]), args.cases)
+
+    plans = [(app.build_differential(c), c["prior_neg"]) for c in cases]
+    pit = iter(range(10**9))
+
+    def orders(trace=None):
+        active, prior_neg = plans[next(pit) % len(plans)]
+        return app.build_orders(active, prior_neg, trace=trace)
+
+    def reference_orders():
+        active, prior_neg = plans[next(pit) % len(plans)]
+        return untraced_orders(active, prior_neg)
+
+    ref = bench("untraced reference orders", reference_orders, args.cases)
+    off = bench("build_orders (trace off)", orders, args.cases)
+    overhead("orders", off, ref)
+    bench("build_orders (trace on)", lambda: orders(app.DecisionTrace()), args.cases)
+
+    def full_plan():
+        case = next_case()
+        active = app.build_differential(case)
+        app.build_note(case, active, app.build_orders(active, case["prior_neg"]))
+
+    bench("differential + orders + note", full_plan, args.cases)
+
+    nnz = args.kb_dx * args.kb_per_dx
+    print(f"-- synthetic CSR ({args.kb_dx} dx x {args.kb_triggers} triggers, {nnz} nnz)")
+    kb = synthetic_kb(args.kb_dx, args.kb_triggers, args.kb_per_dx)
+    rng = np.random.default_rng(1)
+    X = np.zeros((args.batch, args.kb_triggers))
+    for row in X:
+        row[rng.choice(args.kb_triggers, 8, replace=False)] = 1.0
+
+    rows = iter(range(10**9))
+    bench("CSR mat-vec per case", lambda: kb.dot(X[next(rows) % args.batch]), 1000, "case")
+    per_batch = bench(f"CSR mat-mat, batch of {args.batch}", lambda: kb.dot_batch(X), 5, "batch")
+    print(f"{'  -> per case':<48} {per_batch / args.batch * 1e6:>10.1f} us/case")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cases", type=int, default=2000)
+    parser.add_argument("--kb-dx", type=int, default=10000)
+    parser.add_argument("--kb-triggers", type=int, default=2000)
+    parser.add_argument("--kb-per-dx", type=int, default=8)
+    parser.add_argument("--batch", type=int, default=1000)
+    main(parser.parse_args())
@@ -0,0 +1,30 @@
+"""Build the test-sequencing tables ahead of deployment.
+
+    python build_sequencing.py
+
+Writes .fuo_cache/sequencing_v2.json for every diagnosis set up to
+SEQUENCE_TOP_N, keyed by the knowledge-base fingerprint, so the first
+consult does not pay for the build. Re-run after editing DISEASES.
+"""
+
+import argparse
+import os
+import time
+
+# app.py runs its Streamlit layout in bare mode on import; keep that quiet
+os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+
+import app
+
+
+def main(args):
+    start = time.perf_counter()
+    table = app.write_sequencing_table(args.out)
+    print(f"{len(table)} diagnosis sets (top {app.SEQUENCE_TOP_N}) -> {args.out} "
+          f"in {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--out", default=app.SEQUENCE_CACHE)
+    main(parser.parse_args())
@@ -0,0 +1,267 @@
+"""Concurrent-session load test for the FUO Streamlit app.
+
+Starts app.py on a local port, then drives headless browser sessions that
+fill the sidebar with randomized inputs and press "Generate FUO Plan".
+Reports time-to-render percentiles, throughput and server CPU/memory at
+each concurrency level.
+
+    pip install playwright psutil && playwright install chromium
+    python loadtest.py --levels 1 4 16 32 --iterations 5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+try:
+    import psutil
+    from playwright.async_api import async_playwright
+except ImportError as exc:
+    sys.exit(f"loadtest.py needs playwright and psutil ({exc.name} missing): "
+             "pip install playwright psutil && playwright install chromium")
+
+# Widget labels and options come from the app itself, so new inputs are
+# exercised without editing this file. app.py runs its layout in bare mode
+# on import; keep that quiet.
+os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+import app
+
+
+# ================================================================
+# RANDOMIZED INPUTS
+# ================================================================
+
+FINDING_LABELS = [label for _, groups in app.INPUT_SCHEMA for _, widgets in groups for label, _, _ in widgets]
+
+def random_case(rng):
+    immune = rng.choice(app.IMMUNE_STATES)
+    case = {
+        "numbers": {
+            "Age": rng.randint(18, 100),
+            "Tmax (F)": round(rng.uniform(100.4, 104.5), 1),
+            "Heart rate at Tmax": rng.randint(60, 140),
+            "Days of fever": rng.randint(7, 120)
+        },
+        "selects": {"Sex": rng.choice(app.SEXES), "Immune status": immune},
+        "cd4_key": None,
+        "findings": rng.sample(FINDING_LABELS, rng.randint(1, 8)),
+        "prior_neg": rng.sample(app.PRIOR_VOCAB, rng.randint(0, 3))
+    }
+    if immune == "HIV":
+        # The CD4 slider is driven by keyboard: Home = 0, End = 1200, so
+        # both the low-CD4 and the competent branches get load
+        case["cd4_key"] = rng.choice(["Home", "End"])
+    if immune == "Transplant":
+        case["numbers"]["Time since transplant (months)"] = rng.randint(0, 120)
+        case["selects"]["Type of transplant"] = rng.choice(app.TRANSPLANT_TYPES)
+        case["selects"]["EBV status"] = rng.choice(app.EBV_STATUSES)
+    return case
+
+
+# ================================================================
+# SERVER
+# ================================================================
+
+def start_server(port):
+    app = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", app,
+         "--server.headless", "true",
+         "--server.port", str(port),
+         "--browser.gatherUsageStats", "false"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            sys.exit("Streamlit server exited during startup")
+        try:
+            with urllib.request.urlopen(f"http://localhost:{port}/_stcore/health", timeout=1) as r:
+                if r.status == 200:
+                    return proc
+        except OSError:
+            time.sleep(0.25)
+
+    proc.terminate()
+    sys.exit("Streamlit server did not become healthy within 60 s")
+
+class ServerSampler:
+    # Polls CPU and RSS of the server process tree while a level runs
+
+    def __init__(self, pid, interval=0.5):
+        self.proc = psutil.Process(pid)
+        self.interval = interval
+        self.cpu = []
+        self.rss = []
+
+    def tree(self):
+        return [self.proc] + self.proc.children(recursive=True)
+
+    def rss_now(self):
+        return sum(p.memory_info().rss for p in self.tree())
+
+    async def run(self, stop):
+        for p in self.tree():
+            p.cpu_percent(None)
+        while not stop.is_set():
+            await asyncio.sleep(self.interval)
+            procs = self.tree()
+            self.cpu.append(sum(p.cpu_percent(None) for p in procs))
+            self.rss.append(sum(p.memory_info().rss for p in procs))
+
+
+# ================================================================
+# SESSIONS
+# ================================================================
+
+async def run_consult(browser, url, case, timeout_ms):
+    context = await browser.new_context()
+    page = await context.new_page()
+    try:
+        await page.goto(url)
+        sidebar = page.locator("section[data-testid='stSidebar']")
+        run_button = sidebar.get_by_role("button", name="Generate FUO Plan")
+        await run_button.wait_for(timeout=timeout_ms)
+
+        # Immune status first: it reveals the CD4 and transplant widgets
+        for label, value in case["selects"].items():
+            await choose(page, sidebar, "stSelectbox", label, [value], timeout_ms)
+        if case["cd4_key"]:
+            await sidebar.get_by_role("slider").press(case["cd4_key"])
+        for label, value in case["numbers"].items():
+            field = sidebar.get_by_label(label, exact=True)
+            await field.fill(str(value))
+            await field.press("Enter")
+        for label in case["findings"]:
+            await sidebar.get_by_text(label, exact=True).click()
+        if case["prior_neg"]:
+            await choose(page, sidebar, "stMultiSelect", "Mark studies already done and negative",
+                         case["prior_neg"], timeout_ms)
+
+        start = time.perf_counter()
+        await run_button.click()
+        await page.get_by_text("Consult Note Draft", exact=True).wait_for(timeout=timeout_ms)
+        return time.perf_counter() - start
+    finally:
+        await context.close()
+
+async def choose(page, sidebar, testid, label, values, timeout_ms):
+    widget = sidebar.locator(f"div[data-testid='{testid}']").filter(has_text=label)
+    await widget.wait_for(timeout=timeout_ms)
+    for value in values:
+        await widget.click()
+        await page.get_by_role("option", name=value, exact=True).click()
+    await page.keyboard.press("Escape")
+
+async def session_worker(browser, url, rng, iterations, timeout_ms, latencies, errors):
+    for _ in range(iterations):
+        try:
+            latencies.append(await run_consult(browser, url, random_case(rng), timeout_ms))
+        except Exception as exc:
+            errors.append(repr(exc))
+
+def percentile(values, p):
+    if len(values) < 2:
+        return values[0] if values else float("nan")
+    return statistics.quantiles(values, n=100, method="inclusive")[p - 1]
+
+async def run_level(browser, url, sampler, concurrency, iterations, timeout_ms, seed):
+    latencies, errors = [], []
+    baseline_rss = sampler.rss_now()
+    sampler.cpu.clear()
+    sampler.rss.clear()
+
+    stop = asyncio.Event()
+    sampling = asyncio.create_task(sampler.run(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        session_worker(browser, url, random.Random(seed + i), iterations, timeout_ms, latencies, errors)
+        for i in range(concurrency)
+    ])
+    wall = time.perf_counter() - start
+    stop.set()
+    await sampling
+
+    peak_rss = max(sampler.rss, default=baseline_rss)
+    return {
+        "concurrency": concurrency,
+        "runs": len(latencies),
+        "errors": len(errors),
+        "p50_s": percentile(latencies, 50),
+        "p95_s": percentile(latencies, 95),
+        "p99_s": percentile(latencies, 99),
+        "throughput_rps": len(latencies) / wall if wall else 0.0,
+        "cpu_pct_mean": statistics.fmean(sampler.cpu) if sampler.cpu else 0.0,
+        "cpu_pct_per_session": (statistics.fmean(sampler.cpu) / concurrency) if sampler.cpu else 0.0,
+        "rss_peak_mb": peak_rss / 2**20,
+        "rss_per_session_mb": max(peak_rss - baseline_rss, 0) / 2**20 / concurrency,
+        "first_errors": errors[:3]
+    }
+
+
+# ================================================================
+# REPORT
+# ================================================================
+
+COLUMNS = [
+    ("concurrency", "conc", "{:>5}"),
+    ("runs", "runs", "{:>5}"),
+    ("errors", "err", "{:>4}"),
+    ("p50_s", "p50 s", "{:>7.2f}"),
+    ("p95_s", "p95 s", "{:>7.2f}"),
+    ("p99_s", "p99 s", "{:>7.2f}"),
+    ("throughput_rps", "runs/s", "{:>7.2f}"),
+    ("cpu_pct_per_session", "cpu%/sess", "{:>10.1f}"),
+    ("rss_peak_mb", "rss MB", "{:>8.1f}"),
+    ("rss_per_session_mb", "MB/sess", "{:>8.2f}")
+]
+
+def print_row(result):
+    print("  ".join(fmt.format(result[key]) for key, _, fmt in COLUMNS), flush=True)
+
+async def main(args):
+    server = start_server(args.port)
+    url = f"http://localhost:{args.port}/"
+    results = []
+    try:
+        sampler = ServerSampler(server.pid)
+        async with async_playwright() as pw:
+            browser = await pw.chromium.launch(headless=True)
+            print("  ".join(f"{title:>{len(fmt.format(0))}}" for _, title, fmt in COLUMNS))
+            for level in args.levels:
+                result = await run_level(
+                    browser, url, sampler, level, args.iterations, args.timeout * 1000, args.seed
+                )
+                results.append(result)
+                print_row(result)
+                for err in result["first_errors"]:
+                    print(f"    error: {err}")
+            await browser.close()
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32],
+                        help="concurrent sessions per step")
+    parser.add_argument("--iterations", type=int, default=5, help="consults per session")
+    parser.add_argument("--port", type=int, default=8599)
+    parser.add_argument("--timeout", type=float, default=60, help="per-consult timeout (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    asyncio.run(main(parser.parse_args()))